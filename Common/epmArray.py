@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - native EPM arrays
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import datetime as dt
+import numpy as np
+
+
+# Formato das penas no EPM (big-endian e colunas object)
+EPM_DTYPE = np.dtype([('Value', '>f8'), ('Timestamp', 'object'), ('Quality', 'object')])
+
+# Formato nativo: colunas contiguas, float64, datetime64[ns] e status code de 32 bits
+VALUE_DTYPE = np.dtype('f8')
+TIMESTAMP_DTYPE = np.dtype('M8[ns]')
+QUALITY_DTYPE = np.dtype('u4')
+
+NS_PER_SECOND = 1000000000
+
+
+class _UtcTz(dt.tzinfo):
+    # Python 2 nao possui datetime.timezone
+    def utcoffset(self, d):
+        return dt.timedelta(0)
+    def tzname(self, d):
+        return 'UTC'
+    def dst(self, d):
+        return dt.timedelta(0)
+
+try:
+    _UTC = dt.timezone.utc
+except AttributeError:
+    _UTC = _UtcTz()
+
+_STRING_TYPES = (str, type(u''))
+
+
+class EpmArray(object):
+    """ Columnar EPM data: contiguous native Value, Timestamp and Quality arrays.
+    Field access (data['Value'], data['Timestamp'], data['Quality']) works as in the
+    EPM structured arrays, so existing code can use both.
+    >>> data = EpmArray.fromEpm(pen.values)
+    >>> dtSeconds = data.deltaSeconds()
+    >>> sr.plot('penName', data.toEpm())
+    """
+
+    def __init__(self, value, timestamp, quality=None, tz=None, hostDtype=None):
+        self.value = np.ascontiguousarray(value, dtype=VALUE_DTYPE)
+        self.timestamp = np.ascontiguousarray(timestamp, dtype=TIMESTAMP_DTYPE)
+        if quality is None:
+            quality = np.zeros(self.value.size, dtype=QUALITY_DTYPE)
+        self.quality = np.ascontiguousarray(quality, dtype=QUALITY_DTYPE)
+        if not (self.value.size == self.timestamp.size == self.quality.size):
+            raise ValueError('Value, Timestamp and Quality must have the same size.')
+        self.tz = tz
+        self.hostDtype = hostDtype
+
+    @classmethod
+    def fromEpm(cls, epmData):
+        """ Converts an EPM structured array (pen values) into a native EpmArray.
+        >>> data = EpmArray.fromEpm(ds.EpmDatasetAnalysisPens.SelectedPens[0].values)
+        """
+        if isinstance(epmData, EpmArray):
+            return epmData
+        names = epmData.dtype.names
+        timestamp, tz = timestamps2datetime64(epmData['Timestamp'])
+        if 'Quality' in names:
+            quality = quality2native(epmData['Quality'])
+        else:
+            quality = None
+        return cls(epmData['Value'], timestamp, quality, tz=tz, hostDtype=epmData.dtype)
+
+    def toEpm(self, dtype=None):
+        """ Converts back to the EPM structured array format (host boundary).
+        dtype: EPM dtype to build (default is the ingested one or EPM_DTYPE)
+        """
+        if dtype is None:
+            dtype = self.hostDtype if self.hostDtype is not None else EPM_DTYPE
+        epmData = np.empty(self.value.size, dtype=dtype)
+        epmData['Value'] = self.value
+        if dtype['Timestamp'].kind == 'M':
+            epmData['Timestamp'] = self.timestamp
+        else:
+            epmData['Timestamp'] = datetime642timestamps(self.timestamp, self.tz)
+        if 'Quality' in dtype.names:
+            if dtype['Quality'].kind == 'O':
+                epmData['Quality'] = self.quality.astype(np.int64).astype(object)
+            else:
+                epmData['Quality'] = self.quality.astype(dtype['Quality'])
+        return epmData
+
+    def __len__(self):
+        return self.value.size
+
+    def __getitem__(self, key):
+        if isinstance(key, _STRING_TYPES):
+            if key == 'Value':
+                return self.value
+            elif key == 'Timestamp':
+                return self.timestamp
+            elif key == 'Quality':
+                return self.quality
+            raise KeyError(key)
+        return EpmArray(self.value[key], self.timestamp[key], self.quality[key], self.tz, self.hostDtype)
+
+    def __setitem__(self, key, values):
+        if isinstance(key, _STRING_TYPES):
+            self[key][...] = values
+            return
+        # linhas: atribui as tres colunas a partir de outra pena
+        if not isinstance(values, EpmArray):
+            if getattr(getattr(values, 'dtype', None), 'names', None) is None:
+                raise TypeError("Rows must be assigned from an EpmArray or EPM structured array "
+                                "(use data['Value'][key] = values to assign only the values).")
+            values = EpmArray.fromEpm(values)
+        self.value[key] = values.value
+        self.timestamp[key] = values.timestamp
+        self.quality[key] = values.quality
+
+    @property
+    def size(self):
+        return self.value.size
+
+    def copy(self):
+        return EpmArray(self.value.copy(), self.timestamp.copy(), self.quality.copy(), self.tz, self.hostDtype)
+
+    def derive(self, value):
+        """ Derived pen: new Value column sharing the Timestamp and Quality buffers (no copy).
+        >>> zeroMean = data.derive(data['Value'] - st['mean'])
+        """
+        return EpmArray(value, self.timestamp, self.quality, self.tz, self.hostDtype)
+
+    def timestampNs(self):
+        """ Timestamps as int64 nanoseconds (a view, no copy).
+        """
+        return self.timestamp.view(np.int64)
+
+    def deltaSeconds(self):
+        """ Time between consecutive samples in seconds (float64, size n-1).
+        """
+        return np.diff(self.timestampNs()) / float(NS_PER_SECOND)
+
+
+def asEpmArray(epmData):
+    """ Returns epmData as an EpmArray, converting only if needed.
+    """
+    return EpmArray.fromEpm(epmData)
+
+
+def toEpm(epmData, dtype=None):
+    """ Returns epmData as an EPM structured array, converting only if needed.
+    """
+    if isinstance(epmData, EpmArray):
+        return epmData.toEpm(dtype)
+    return epmData
+
+
+def derivedPen(epmData, value=None):
+    """ Derived pen with the Timestamp and Quality of epmData and a new Value column.
+    EpmArray: shares the Timestamp and Quality buffers (see EpmArray.derive).
+    EPM structured array: a single output allocation with the Timestamp and Quality
+    references; with value=None the Value column is left to be filled in place
+    (e.g. np.subtract(v, mean, out=res['Value'])), without temporary copies.
+    """
+    if isinstance(epmData, EpmArray):
+        if value is None:
+            value = np.empty(epmData.size, dtype=VALUE_DTYPE)
+        return epmData.derive(value)
+    res = np.empty(epmData.shape, dtype=epmData.dtype)
+    for name in epmData.dtype.names:
+        if name != 'Value':
+            res[name] = epmData[name]
+    if value is not None:
+        res['Value'] = value
+    return res
+
+
+def constantPen(epmData, value):
+    """ Constant (reference) line over the period of epmData with only two points,
+    the first and the last timestamps.
+    >>> penMax = constantPen(epmData, st['max'])
+    """
+    n = len(epmData)
+    res = epmData[[0, n - 1] if n > 1 else list(range(n))]
+    res['Value'] = value
+    return res
+
+
+def vec2epm(t, y, quality=None, dtype=None, tz=None):
+    """ Converts datetime vector and data vector into EPM array (numpy array)
+    t: datetime vector (datetime objects or datetime64)
+    y: double data vector
+    tz: timezone of the returned timestamps when t is datetime64 (UTC)
+    """
+    timestamp, tzFound = timestamps2datetime64(t)
+    if tz is None:
+        tz = tzFound
+    return EpmArray(y, timestamp, quality, tz=tz).toEpm(dtype)
+
+
+def timestamps2datetime64(t):
+    """ Converts a timestamp vector into datetime64[ns] (UTC when timezone aware).
+    Returns the converted vector and the timezone found (or None).
+    """
+    t = np.asarray(t)
+    if t.dtype.kind == 'M':
+        return t.astype(TIMESTAMP_DTYPE), None
+    tz = None
+    if t.size and getattr(t.flat[0], 'tzinfo', None) is not None:
+        tz = t.flat[0].tzinfo
+        t = np.array([d.astimezone(_UTC).replace(tzinfo=None) for d in t], dtype='M8[us]')
+    return t.astype('M8[us]').astype(TIMESTAMP_DTYPE), tz
+
+
+def datetime642timestamps(t, tz=None):
+    """ Converts a datetime64 vector into datetime objects (object array).
+    tz: if informed, datetimes are returned timezone aware on tz
+    """
+    t = np.asarray(t).astype('M8[us]').astype(object)
+    if tz is not None:
+        t = np.array([d.replace(tzinfo=_UTC).astimezone(tz) for d in t], dtype=object)
+    return t
+
+
+def quality2native(quality):
+    """ Converts EPM quality (object, signed or unsigned) into 32 bits status codes.
+    """
+    return np.asarray(quality).astype(np.int64).astype(QUALITY_DTYPE)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - benchmarks of the shared kernels
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+
+Usage (results appended as JSON lines to the output file):
+    python epmBenchmark.py --sizes 1e4 1e5 1e6 --output bench_output.txt
+    python epmBenchmark.py --compare before.txt after.txt
+'''
+
+import sys
+import time
+import json
+import argparse
+import platform
+import datetime as dt
+from collections import OrderedDict
+import numpy as np
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None  # Python 2: sem perfil de memoria
+
+import epmArray as ea
+import epmTimeStats as ets
+import epmOutliers as eo
+import epmFilters as ef
+import epmStats as es
+import epmWind as ew
+
+
+_clock = getattr(time, 'perf_counter', time.time)
+
+SIZES = [10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8]
+KINDS = ['regular', 'irregular', 'nan', 'gaps']
+
+
+def synthEpmData(n, kind='regular', period=1.0, nanFraction=0.01, gapFraction=0.001, gapSeconds=3600.0, seed=0):
+    """ Synthetic pen (EpmArray) with n samples: slow sine + random walk + noise.
+    kind: 'regular' (fixed period), 'irregular' (exponential intervals with mean period),
+          'nan' (regular with nanFraction of NaN values) or 'gaps' (regular with
+          gapFraction of the intervals extended by gapSeconds)
+    """
+    rng = np.random.RandomState(seed)
+    if kind == 'irregular':
+        dtSec = rng.exponential(period, n)
+    else:
+        dtSec = np.full(n, period)
+    if kind == 'gaps':
+        dtSec[rng.rand(n) < gapFraction] += gapSeconds
+    dtSec[0] = 0.0
+    tNs = np.cumsum(np.round(dtSec * ea.NS_PER_SECOND).astype(np.int64))
+    tNs += np.datetime64('2018-01-01T00:00:00', 'ns').astype(np.int64)
+    y = 50.0 + 20.0 * np.sin(2.0 * np.pi * np.arange(n) / 86400.0)
+    y += np.cumsum(rng.normal(0.0, 0.05, n))
+    y += rng.normal(0.0, 1.0, n)
+    if kind == 'nan':
+        y[rng.rand(n) < nanFraction] = np.nan
+    return ea.EpmArray(y, tNs.view(ea.TIMESTAMP_DTYPE))
+
+
+def synthWindData(n, seed=0):
+    """ Synthetic wind turbine data: speed (Weibull), power (PN4 curve + noise) and direction.
+    """
+    rng = np.random.RandomState(seed)
+    speed = 8.0 * rng.weibull(2.0, n)
+    power = ew.powerFitPn4([0.9, -7.0, 3000.0, 1.0], speed) + rng.normal(0.0, 50.0, n)
+    direction = rng.vonmises(np.pi / 4.0, 1.0, n) * 180.0 / np.pi + 180.0
+    return speed, power, direction
+
+
+# Casos: nome -> (funcao(data, wind), usa apenas wind); wind = (speed, power, direction)
+# Os casos de vento nao dependem do tipo da pena: rodam uma vez por tamanho (kind 'wind')
+CASES = OrderedDict([
+    ('filtMean', (lambda data, wind: ef.movingAverage(data['Value'], 600, 'leading', 'hold'), False)),
+    ('filter1st', (lambda data, wind: ef.FirstOrderFilter(60.0).filter(data['Value'], data['Timestamp']), False)),
+    ('FiltFilt', (lambda data, wind: ef.zeroPhaseFilter(data['Value'], 2, 0.3), False)),
+    ('percentTimeIn', (lambda data, wind: ets.percentTimeIn(data['Timestamp'], data['Value'],
+                                                            np.arange(0.0, 100.0, 10.0)), False)),
+    ('windPowerAverage', (lambda data, wind: ew.windPowerAverage(wind[0], wind[1]), True)),
+    ('invCount', (lambda data, wind: es.countReversals(data['Value']), False)),
+    ('describe', (lambda data, wind: es.describe(data['Value'], (10, 50, 90)), False)),
+    ('rmNanAndOutliers', (lambda data, wind: eo.rmNanAndOutliers(data), False)),
+    ('powerCurveFit', (lambda data, wind: ew.fitPowerCurve(wind[0], wind[1]), True)),
+])
+
+
+def timeCase(func, args, repeat=3):
+    """ Runs func(*args) repeat times and returns the list of elapsed times (seconds).
+    """
+    times = []
+    for i in range(repeat):
+        t0 = _clock()
+        func(*args)
+        times.append(_clock() - t0)
+    return times
+
+
+def peakMemory(func, args):
+    """ Peak memory (bytes) allocated while running func(*args), or None without tracemalloc.
+    """
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def runBenchmarks(sizes=SIZES, kinds=KINDS, cases=None, repeat=3, output=None, memory=True):
+    """ Runs the cases for each size and kind of synthetic data and returns the results
+    (list of dicts); if output is informed, appends them as JSON lines. The wind cases
+    run once per size (kind 'wind'), over wind data built once.
+    """
+    if cases is None:
+        cases = list(CASES.keys())
+    info = {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'date': dt.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}
+    results = []
+
+    def run(name, kind, n, args):
+        func = CASES[name][0]
+        times = timeCase(func, args, repeat)
+        result = OrderedDict([('case', name), ('kind', kind), ('n', n), ('repeat', repeat),
+                              ('best', min(times)), ('median', float(np.median(times))),
+                              ('peakBytes', peakMemory(func, args) if memory else None)])
+        result.update(info)
+        results.append(result)
+        print('%-18s %-10s %10d %10.4f s' % (name, kind, n, result['best']))
+        if output is not None:
+            with open(output, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+
+    for n in sizes:
+        n = int(n)
+        penCases = [name for name in cases if not CASES[name][1]]
+        windCases = [name for name in cases if CASES[name][1]]
+        if windCases:
+            args = (None, synthWindData(n))
+            for name in windCases:
+                run(name, 'wind', n, args)
+            del args
+        if penCases:
+            for kind in kinds:
+                args = (synthEpmData(n, kind), None)
+                for name in penCases:
+                    run(name, kind, n, args)
+                del args
+    return results
+
+
+def readResults(fileName):
+    """ Reads the JSON lines written by runBenchmarks (last result of each case, kind and size).
+    """
+    results = OrderedDict()
+    with open(fileName) as f:
+        for line in f:
+            if line.strip():
+                result = json.loads(line)
+                results[(result['case'], result['kind'], result['n'])] = result
+    return results
+
+
+def compareResults(beforeFile, afterFile):
+    """ Prints the speedup (before / after best time) and the memory ratio of the common results.
+    """
+    before = readResults(beforeFile)
+    after = readResults(afterFile)
+    print('%-18s %-10s %10s %10s %10s %8s %8s' % ('case', 'kind', 'n', 'before', 'after', 'speedup', 'memory'))
+    for key, res in after.items():
+        if key not in before:
+            continue
+        old = before[key]
+        memRatio = float('nan')
+        if res['peakBytes'] and old['peakBytes']:
+            memRatio = res['peakBytes'] / float(old['peakBytes'])
+        print('%-18s %-10s %10d %10.4f %10.4f %8.2f %8.2f' % (key + (old['best'], res['best'],
+                                                                   old['best'] / res['best'], memRatio)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='EPM Dataset Analysis kernels benchmark')
+    parser.add_argument('--sizes', nargs='+', type=float, default=SIZES, help='number of samples (1e4 ... 1e8)')
+    parser.add_argument('--kinds', nargs='+', default=KINDS, choices=KINDS)
+    parser.add_argument('--cases', nargs='+', default=list(CASES.keys()), choices=list(CASES.keys()))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_output.txt')
+    parser.add_argument('--no-memory', dest='memory', action='store_false')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+    if args.compare:
+        compareResults(*args.compare)
+        sys.exit(0)
+    runBenchmarks(args.sizes, args.kinds, args.cases, args.repeat, args.output, args.memory)
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - noise filters
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import numpy as np
+from scipy.signal import lfilter, butter, sosfilt, sosfilt_zi, sosfiltfilt
+import epmArray as ea
+
+
+def _windowOffsets(o, mode):
+    # Numero de amostras antes (back) e depois (ahead) da amostra atual na janela de ordem o
+    if mode == 'trailing':
+        return o - 1, 0
+    elif mode == 'centered':
+        return o // 2, o - 1 - o // 2
+    elif mode == 'leading':
+        return 0, o - 1
+    raise ValueError("mode must be 'trailing', 'centered' or 'leading'.")
+
+
+class MovingAverage(object):
+    """ Moving average of order o computed with cumulative sums (O(n) for any o).
+    mode: 'trailing' (o last samples), 'centered' or 'leading' (current and o-1 next samples)
+    edge: policy where the window is incomplete (series start or end):
+          'shrink' (mean of the available samples), 'hold' (repeats the nearest full window
+          mean) or 'nan'
+    NaN samples are skipped inside the windows.
+    The filter keeps its state, so a long series can be filtered chunk by chunk: the
+    concatenation of the filter() outputs and of flush() is equal to a single pass.
+    Centered and leading modes need future samples, so each chunk returns only the
+    outputs already complete (the last ones come in the next chunks or in flush()).
+    >>> ma = MovingAverage(60, mode='centered')
+    >>> y = np.concatenate([ma.filter(chunk) for chunk in chunks] + [ma.flush()])
+    """
+
+    def __init__(self, o, mode='trailing', edge='shrink'):
+        if o < 1:
+            raise ValueError('Order must be >= 1.')
+        if edge not in ('shrink', 'hold', 'nan'):
+            raise ValueError("edge must be 'shrink', 'hold' or 'nan'.")
+        self.o = int(o)
+        self.mode = mode
+        self.edge = edge
+        self.back, self.ahead = _windowOffsets(self.o, mode)
+        self.tail = np.zeros(0)  # ultimas o-1 amostras de entrada
+        self.nIn = 0  # amostras recebidas
+        self.nOut = 0  # amostras calculadas (emitidas ou pendentes)
+        self.pending = 0  # edge='hold': saidas iniciais aguardando a primeira janela completa
+        self.lastFull = np.nan  # media da ultima janela completa
+
+    def filter(self, x):
+        """ Filters the next chunk and returns the outputs already complete.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        ext = np.concatenate((self.tail, x))
+        start = self.tail.size
+        valid = ~np.isnan(ext)
+        c = np.concatenate(([0.0], np.cumsum(np.where(valid, ext, 0.0))))
+        k = np.concatenate(([0], np.cumsum(valid)))
+        hi = np.arange(start, ext.size) + 1
+        lo = np.maximum(hi - self.o, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (c[hi] - c[lo]) / (k[hi] - k[lo])
+        self.tail = ext[max(ext.size - self.o + 1, 0):] if self.o > 1 else np.zeros(0)
+        # saida j corresponde a janela que termina na entrada j + ahead
+        skip = self.nOut - (self.nIn - self.ahead)
+        self.nIn += x.size
+        if skip > 0:
+            means = means[skip:]
+        self.nOut += means.size
+        j0 = self.nOut - means.size
+        out = means
+        nStart = min(max(self.back - j0, 0), means.size)  # saidas com janela incompleta no inicio
+        if nStart > 0:
+            if self.edge == 'nan':
+                out[:nStart] = np.nan
+            elif self.edge == 'hold':
+                self.pending += nStart
+                out = out[nStart:]
+        if self.pending and self.edge == 'hold' and out.size > 0 and nStart < means.size:
+            out = np.concatenate((np.repeat(out[0], self.pending), out))
+            self.pending = 0
+        if means.size > nStart:
+            self.lastFull = means[-1]
+        return out
+
+    def flush(self):
+        """ Returns the last outputs (windows incomplete at the series end).
+        """
+        n = self.nIn - self.nOut
+        if self.edge == 'hold' and self.pending:
+            # serie menor que a janela: nenhuma janela completa
+            out = np.full(self.pending + n, np.nan)
+            self.pending = 0
+        elif self.edge == 'shrink':
+            # janelas [j - back, fim da serie], com somas acumuladas reversas da cauda
+            valid = ~np.isnan(self.tail)
+            c = np.concatenate((np.cumsum(np.where(valid, self.tail, 0.0)[::-1])[::-1], [0.0]))
+            k = np.concatenate((np.cumsum(valid[::-1])[::-1], [0]))
+            j = np.arange(self.nOut, self.nIn)
+            lo = np.maximum(self.tail.size - (self.nIn - (j - self.back)), 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = c[lo] / k[lo]
+        elif self.edge == 'hold':
+            out = np.full(n, self.lastFull)
+        else:
+            out = np.full(n, np.nan)
+        self.nOut = self.nIn
+        return out
+
+
+def movingAverage(x, o, mode='trailing', edge='shrink'):
+    """ Moving average of order o (see MovingAverage) of the whole vector x.
+    >>> y = movingAverage(epmData['Value'], 12, mode='centered')
+    """
+    ma = MovingAverage(o, mode, edge)
+    return np.concatenate((ma.filter(x), ma.flush()))
+
+
+def _linearRecurrence(a, b, y0):
+    # y[i] = a[i] * y[i-1] + b[i] com coeficientes variaveis (a em [0, 1]): varredura
+    # vetorizada por dobramento (log2(n) passos), estavel pois so multiplica fatores <= 1
+    a = a.copy()
+    b = b.copy()
+    n = a.size
+    d = 1
+    while d < n:
+        b[d:] += a[d:] * b[:-d]
+        a[d:] = a[d:] * a[:-d]
+        d *= 2
+        if not a[d - 1:].any():
+            break
+    return b + a * y0
+
+
+class FirstOrderFilter(object):
+    """ First order (exponential moving average) filter with time constant fp:
+    y[i] = a * y[i-1] + (1 - a) * x[i], a = exp(-dt / fp)
+    st: fixed sample time (recursion runs in C with lfilter); None uses the real
+        Timestamp deltas (dt per sample, for irregularly sampled pens)
+    NaN samples keep the previous output (NaN before the first valid sample stay NaN).
+    The state (last output and last timestamp) can be saved in session.userCache, so an
+    EPM Processor method filters only the new interval at each execution.
+    >>> flt = FirstOrderFilter(60.0)
+    >>> if 'filter1st' in session.userCache:
+    ...     flt = FirstOrderFilter.fromState(json.loads(session.userCache['filter1st']))
+    >>> y = flt.filter(epmData['Value'], epmData['Timestamp'])
+    >>> session.userCache['filter1st'] = json.dumps(flt.getState())
+    """
+
+    def __init__(self, fp, st=None):
+        if fp <= 0:
+            raise ValueError('Time constant must be > 0.')
+        self.fp = float(fp)
+        self.st = None if st is None else float(st)
+        self.y = None  # ultima saida do filtro
+        self.lastNs = None  # timestamp (ns) da ultima amostra
+
+    def filter(self, x, t=None):
+        """ Filters the next chunk of samples (t is required when st is None).
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if x.size == 0:
+            return x.copy()
+        valid = ~np.isnan(x)
+        lead = 0  # NaN antes da primeira amostra valida continuam NaN
+        if self.y is None:
+            if not valid.any():
+                return x.copy()
+            lead = int(np.argmax(valid))
+            self.y = x[lead]  # inicia com a primeira amostra valida
+        if self.st is None:
+            if t is None:
+                raise ValueError('Timestamps are required when st is None.')
+            t, tz = ea.timestamps2datetime64(t)
+            tNs = t.view(np.int64)
+            first = tNs[0] if self.lastNs is None else self.lastNs
+            if tNs[0] < first:
+                raise ValueError('Chunks must be informed in time order.')
+            dt = np.diff(np.concatenate(([first], tNs))) / float(ea.NS_PER_SECOND)
+            a = np.exp(-dt / self.fp)
+            self.lastNs = int(tNs[-1])
+        else:
+            a = np.exp(-self.st / self.fp)
+        if self.st is not None and valid.all():
+            y, zf = lfilter([1.0 - a], [1.0, -a], x, zi=[a * self.y])
+        else:
+            a = np.broadcast_to(a, x.shape)
+            y = _linearRecurrence(np.where(valid, a, 1.0), np.where(valid, (1.0 - a) * x, 0.0), self.y)
+            y[:lead] = np.nan
+        self.y = float(y[-1])
+        return y
+
+    def getState(self):
+        """ Returns the filter state as a JSON serializable dict.
+        """
+        return {'fp': self.fp, 'st': self.st, 'y': self.y, 'lastNs': self.lastNs}
+
+    @classmethod
+    def fromState(cls, state):
+        """ Rebuilds a filter from getState().
+        """
+        flt = cls(state['fp'], state['st'])
+        flt.y, flt.lastNs = state['y'], state['lastNs']
+        return flt
+
+
+_SOS_CACHE_SIZE = 64
+_sosCache = {}
+
+
+def butterSos(o, w, btype='low'):
+    """ Butterworth filter of order o and normalized cutoff w (1 = Nyquist) as second
+    order sections. Designed coefficients are cached.
+    """
+    key = (int(o), tuple(np.atleast_1d(w).tolist()), btype)
+    sos = _sosCache.get(key)
+    if sos is None:
+        if len(_sosCache) >= _SOS_CACHE_SIZE:
+            _sosCache.clear()
+        sos = butter(o, w, btype=btype, output='sos')
+        _sosCache[key] = sos
+    return sos
+
+
+def zeroPhaseFilter(x, o=2, w=0.3, btype='low', axis=0):
+    """ Zero phase (forward and backward) Butterworth filter with second order sections,
+    stable at high orders. x can be a vector or a 2-D block of aligned pens
+    (samples x channels), all filtered in a single call along axis.
+    The signal is extended at the ends by odd reflection (about 3 * number of taps).
+    >>> yf = zeroPhaseFilter(np.column_stack([pen1['Value'], pen2['Value']]), 4, 0.1)
+    """
+    sos = butterSos(o, w, btype)
+    return sosfiltfilt(sos, np.asarray(x, dtype=np.float64), axis=axis, padtype='odd')
+
+
+# Tamanho padrao das partes (amostras) nos modos fora da memoria
+CHUNK_SIZE = 1 << 20
+
+
+def _flush(dst):
+    if hasattr(dst, 'flush'):
+        dst.flush()
+    return dst
+
+
+def chunkedMovingAverage(src, dst, o, mode='trailing', edge='shrink', chunkSize=CHUNK_SIZE):
+    """ Out-of-core moving average: reads src and writes dst (e.g. memory-mapped arrays)
+    chunk by chunk, with the same result as movingAverage(src, o, mode, edge).
+    >>> src = np.load('pressure.npy', mmap_mode='r')
+    >>> dst = np.lib.format.open_memmap('pressureMA.npy', 'w+', np.float64, src.shape)
+    >>> chunkedMovingAverage(src, dst, 3600, mode='centered')
+    """
+    ma = MovingAverage(o, mode, edge)
+    pos = 0
+    for i in range(0, len(src), chunkSize):
+        y = ma.filter(src[i:i + chunkSize])
+        dst[pos:pos + y.size] = y
+        pos += y.size
+    y = ma.flush()
+    dst[pos:pos + y.size] = y
+    return _flush(dst)
+
+
+def chunkedFirstOrder(src, dst, fp, st=None, t=None, chunkSize=CHUNK_SIZE):
+    """ Out-of-core first order filter (see FirstOrderFilter); t (timestamps, also
+    memory-mapped if needed) is required when st is None.
+    """
+    flt = FirstOrderFilter(fp, st)
+    for i in range(0, len(src), chunkSize):
+        ti = None if t is None else t[i:i + chunkSize]
+        dst[i:i + chunkSize] = flt.filter(src[i:i + chunkSize], ti)
+    return _flush(dst)
+
+
+def chunkedFir(src, dst, b, chunkSize=CHUNK_SIZE):
+    """ Out-of-core causal FIR filter with coefficients b (overlap-add): each chunk is
+    convolved with b and its last len(b)-1 outputs are added to the next chunk.
+    Same result as lfilter(b, 1, src).
+    """
+    b = np.asarray(b, dtype=np.float64)
+    overlap = np.zeros(b.size - 1)
+    for i in range(0, len(src), chunkSize):
+        x = np.asarray(src[i:i + chunkSize], dtype=np.float64)
+        y = np.convolve(x, b)
+        y[:overlap.size] += overlap
+        dst[i:i + x.size] = y[:x.size]
+        overlap = y[x.size:]
+    return _flush(dst)
+
+
+def _padLen(sos):
+    # Mesmo comprimento de extensao usado por sosfiltfilt
+    ntaps = 2 * sos.shape[0] + 1
+    ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+    return 3 * ntaps
+
+
+def chunkedZeroPhaseFilter(src, dst, o=2, w=0.3, btype='low', chunkSize=CHUNK_SIZE):
+    """ Out-of-core version of zeroPhaseFilter (axis 0, vector or samples x channels).
+    The forward pass runs over the chunks carrying the filter state and writes into dst;
+    the backward pass runs over dst from the last chunk to the first, also carrying the
+    state. The odd extensions at the ends are the same of the in-memory filter, so the
+    result matches zeroPhaseFilter; dst may be src itself (in place).
+    >>> src = np.load('vibration.npy', mmap_mode='r')
+    >>> dst = np.lib.format.open_memmap('vibrationF.npy', 'w+', np.float64, src.shape)
+    >>> chunkedZeroPhaseFilter(src, dst, 4, 0.05)
+    """
+    sos = butterSos(o, w, btype)
+    n = len(src)
+    padlen = _padLen(sos)
+    if n <= padlen:
+        raise ValueError('The length of the input must be greater than %d.' % padlen)
+    zi = sosfilt_zi(sos)
+    first = np.array(src[:padlen + 1], dtype=np.float64)
+    last = np.array(src[n - padlen - 1:], dtype=np.float64)
+    x0, xn = first[0], last[-1]
+    zi = zi.reshape(zi.shape + (1,) * (first.ndim - 1))
+    # Sentido direto: extensao inicial e partes com estado
+    startPad = 2 * x0 - first[:0:-1]
+    y, z = sosfilt(sos, startPad, axis=0, zi=zi * startPad[0])
+    for i in range(0, n, chunkSize):
+        y, z = sosfilt(sos, np.asarray(src[i:i + chunkSize], dtype=np.float64), axis=0, zi=z)
+        dst[i:i + chunkSize] = y
+    endPad = 2 * xn - last[-2::-1]
+    y, z = sosfilt(sos, endPad, axis=0, zi=z)
+    # Sentido inverso: comeca pela extensao final e percorre as partes do fim para o inicio
+    y, z = sosfilt(sos, y[::-1], axis=0, zi=zi * y[-1])
+    for i in range(((n - 1) // chunkSize) * chunkSize, -1, -chunkSize):
+        y, z = sosfilt(sos, np.asarray(dst[i:i + chunkSize], dtype=np.float64)[::-1], axis=0, zi=z)
+        dst[i:i + chunkSize] = y[::-1]
+    return _flush(dst)
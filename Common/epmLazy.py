@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - lazy fused transforms of pen values
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import numpy as np
+import epmArray as ea
+import epmOutliers as eo
+
+
+# Tamanho dos blocos das passadas (cabem na cache do processador)
+BLOCK_SIZE = 1 << 16
+
+
+class _Stats(object):
+    # Media e desvio padrao conhecidos do fluxo atual (ou None)
+    def __init__(self, mean, std):
+        self.mean = mean
+        self.std = std
+
+
+class LazyPen(object):
+    """ Lazy chain of transforms over pen values: each method only records the step and
+    returns a new LazyPen; nothing runs until compute() or toEpm(). The chain is then
+    evaluated in blocks, fusing the steps: consecutive affine steps are merged, the mean
+    and std needed by removeMean/normalize are tracked through affine steps or computed in
+    the same pass that builds an outlier mask, and the result is written into a single
+    output allocation (Timestamp/Quality are shared when no sample is removed).
+    >>> res = LazyPen(pen.values).rmNanAndOutliers().removeMean().normalize().delta().toEpm()
+    """
+
+    def __init__(self, epmData, steps=()):
+        self.epmData = epmData
+        self.steps = tuple(steps)
+
+    def _then(self, *step):
+        return LazyPen(self.epmData, self.steps + (step,))
+
+    def rmNanAndOutliers(self, sd=6):
+        """ Removes NaN and outliers (see epmOutliers.nanOutliersMask).
+        """
+        return self._then('rmNanAndOutliers', sd)
+
+    def removeMean(self):
+        return self._then('removeMean')
+
+    def normalize(self):
+        """ (values - mean) / std.
+        """
+        return self._then('normalize')
+
+    def delta(self):
+        """ Difference to the previous sample (first sample = 0, as deltaVector).
+        """
+        return self._then('delta')
+
+    def affine(self, a=1.0, b=0.0):
+        """ a * values + b (e.g. unit conversion).
+        """
+        return self._then('affine', a, b)
+
+    def compute(self):
+        """ Runs the chain and returns the result (same format of the source: EpmArray or
+        EPM structured array).
+        """
+        values = self.epmData['Value']
+        n = len(values)
+        ops = []
+        stats = None
+        for step in self.steps:
+            name = step[0]
+            if name == 'affine':
+                stats = _appendAffine(ops, step[1], step[2], stats)
+            elif name == 'delta':
+                ops.append(['delta'])
+                stats = None
+            elif name in ('removeMean', 'normalize'):
+                if stats is None:
+                    acc = eo.OnlineOutlierFilter()
+                    for v in _stream(values, ops):
+                        acc.update(v)
+                    stats = _Stats(acc.mean, acc.std())
+                if name == 'removeMean':
+                    stats = _appendAffine(ops, 1.0, -stats.mean, stats)
+                else:
+                    stats = _appendAffine(ops, 1.0 / stats.std, -stats.mean / stats.std, stats)
+            elif name == 'rmNanAndOutliers':
+                flt = eo.OnlineOutlierFilter(step[1])
+                for v in _stream(values, ops):
+                    flt.update(v)
+                # mesma passada: mascara e estatisticas das amostras mantidas
+                keep = np.empty(_streamSize(n, ops), dtype=bool)
+                acc = eo.OnlineOutlierFilter()
+                pos = 0
+                for v in _stream(values, ops):
+                    m = flt.mask(v)
+                    keep[pos:pos + v.size] = m
+                    acc.update(v[m])
+                    pos += v.size
+                ops.append(['mask', keep])
+                stats = _Stats(acc.mean, acc.std())
+            else:
+                raise ValueError('Unknown step: ' + str(name))
+        return self._materialize(values, ops)
+
+    def toEpm(self, dtype=None):
+        """ Runs the chain and returns an EPM structured array (to plot or return).
+        """
+        return ea.toEpm(self.compute(), dtype)
+
+    def _materialize(self, values, ops):
+        masks = [op[1] for op in ops if op[0] == 'mask']
+        if not masks:
+            res = ea.derivedPen(self.epmData)
+        else:
+            kept = np.arange(len(values))
+            for keep in masks:
+                kept = kept[keep]
+            res = self.epmData[kept]
+        out = res['Value']
+        pos = 0
+        for v in _stream(values, ops):
+            out[pos:pos + v.size] = v
+            pos += v.size
+        return res
+
+
+def _appendAffine(ops, a, b, stats):
+    # Junta passos afins consecutivos e atualiza as estatisticas conhecidas
+    if ops and ops[-1][0] == 'affine':
+        a0, b0 = ops[-1][1], ops[-1][2]
+        ops[-1] = ['affine', a * a0, a * b0 + b]
+    else:
+        ops.append(['affine', a, b])
+    if stats is None:
+        return None
+    return _Stats(a * stats.mean + b, abs(a) * stats.std)
+
+
+def _streamSize(n, ops):
+    for op in ops:
+        if op[0] == 'mask':
+            n = int(np.count_nonzero(op[1]))
+    return n
+
+
+def _stream(values, ops, blockSize=BLOCK_SIZE):
+    # Gera os valores transformados por ops, bloco a bloco
+    prev = [None] * len(ops)  # ultimo valor antes de cada delta
+    cursor = [0] * len(ops)  # posicao de cada mascara
+    for i in range(0, len(values), blockSize):
+        v = np.array(values[i:i + blockSize], dtype=np.float64)
+        for k, op in enumerate(ops):
+            if op[0] == 'affine':
+                if op[1] != 1.0:
+                    v *= op[1]
+                if op[2] != 0.0:
+                    v += op[2]
+            elif op[0] == 'delta':
+                if v.size == 0:
+                    continue
+                d = np.empty_like(v)
+                d[0] = 0.0 if prev[k] is None else v[0] - prev[k]
+                np.subtract(v[1:], v[:-1], out=d[1:])
+                prev[k] = v[-1]
+                v = d
+            else:
+                m = op[1][cursor[k]:cursor[k] + v.size]
+                cursor[k] += v.size
+                v = v[m]
+        yield v
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - NaN and outliers filters
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import numpy as np
+import epmArray as ea
+
+
+def outlierBand(std, sd=6):
+    """ Half width of the accepted band around the mean: floor(sd * sqrt(std)).
+    """
+    return np.floor(sd * np.sqrt(std))
+
+
+def nanOutliersMask(y, sd=6):
+    """ Whole array mode: returns the mask of the samples to keep (not NaN and inside
+    mean +/- outlierBand, with mean and std of the valid samples).
+    >>> keep = nanOutliersMask(epmData['Value'])
+    >>> t, y = epmData['Timestamp'][keep], epmData['Value'][keep]
+    """
+    y = np.asarray(y, dtype=np.float64)
+    keep = ~np.isnan(y)
+    if not keep.any():
+        return keep
+    yValid = y[keep] if not keep.all() else y
+    mean = yValid.mean()
+    s3 = outlierBand(yValid.std(), sd)
+    keep &= np.abs(np.where(keep, y, mean) - mean) <= s3
+    return keep
+
+
+def rmNanAndOutliers(epmData, sd=6):
+    """ Removes missing data and outliers and returns the native vectors t (datetime64) and y.
+    >>> t, y = rmNanAndOutliers(epmData)
+    """
+    data = ea.asEpmArray(epmData)
+    keep = nanOutliersMask(data['Value'], sd)
+    return data['Timestamp'][keep], data['Value'][keep]
+
+
+class OnlineOutlierFilter(object):
+    """ Chunked (streaming) mode: keeps running count, mean and variance (Welford/Chan)
+    of the valid samples, so a pen can be filtered chunk by chunk in bounded memory.
+    filter(y) updates the statistics with the chunk and returns its mask; for the same
+    result as the whole array mode, update all chunks first and then call mask(y).
+    >>> flt = OnlineOutlierFilter(sd=6)
+    >>> for chunk in chunks:
+    ...     keep = flt.filter(chunk['Value'])
+    """
+
+    def __init__(self, sd=6):
+        self.sd = sd
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, y):
+        """ Adds a chunk to the running statistics.
+        """
+        y = np.asarray(y, dtype=np.float64)
+        y = y[~np.isnan(y)]
+        n = y.size
+        if n == 0:
+            return self
+        mean = y.mean()
+        m2 = np.dot(y - mean, y - mean)
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+        return self
+
+    def std(self):
+        if self.count == 0:
+            return np.nan
+        return np.sqrt(self.m2 / self.count)
+
+    def mask(self, y):
+        """ Mask of the samples to keep using the current statistics.
+        """
+        y = np.asarray(y, dtype=np.float64)
+        s3 = outlierBand(self.std(), self.sd)
+        with np.errstate(invalid='ignore'):
+            return np.abs(y - self.mean) <= s3
+
+    def filter(self, y):
+        return self.update(y).mask(y)
+
+    def getState(self):
+        return {'sd': self.sd, 'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+    @classmethod
+    def fromState(cls, state):
+        flt = cls(state['sd'])
+        flt.count, flt.mean, flt.m2 = state['count'], state['mean'], state['m2']
+        return flt
+
+
+def rollingOutliersMask(y, window, sd=6):
+    """ Rolling window mode: each sample is compared to the mean and std of the valid
+    samples in the trailing window (window samples, including itself).
+    >>> keep = rollingOutliersMask(epmData['Value'], 3600)
+    """
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    if not valid.any():
+        return valid
+    # Desloca pela media para reduzir o erro numerico das somas acumuladas
+    offset = y[valid].mean()
+    yv = np.where(valid, y - offset, 0.0)
+    def windowSum(v):
+        c = np.cumsum(v, dtype=np.float64)
+        c[window:] = c[window:] - c[:-window]
+        return c
+    count = windowSum(valid.astype(np.float64))
+    s1 = windowSum(yv)
+    s2 = windowSum(yv * yv)
+    n = np.maximum(count, 1.0)
+    mean = s1 / n
+    var = np.maximum(s2 / n - mean * mean, 0.0)
+    keep = valid & (np.abs(yv - mean) <= outlierBand(np.sqrt(var), sd))
+    return keep
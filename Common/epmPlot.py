@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - plot helpers (level of detail, heatmaps)
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import numpy as np
+
+
+def indexRange(x, xmin, xmax):
+    """ Range [i0, i1[ of the samples of x (sorted) inside [xmin, xmax].
+    """
+    return int(np.searchsorted(x, xmin, side='left')), int(np.searchsorted(x, xmax, side='right'))
+
+
+def nearestIndex(x, value):
+    """ Index of the sample of x (sorted) nearest to value.
+    """
+    i = int(np.searchsorted(x, value))
+    if i >= len(x):
+        return len(x) - 1
+    if i > 0 and value - x[i - 1] <= x[i] - value:
+        return i - 1
+    return i
+
+
+def _firstPerSegment(mask, seg):
+    idx = np.flatnonzero(mask)
+    s = seg[idx]
+    return idx[np.concatenate(([True], s[1:] != s[:-1]))] if idx.size else idx
+
+
+def minMaxIndices(x, y, nBins, lo=0, hi=None):
+    """ Indices of the minimum and maximum of y in each of nBins equal columns of
+    x[lo:hi] (x sorted), plus the first and last samples: the decimated line looks the
+    same as the full one at nBins pixels of width. NaN values are ignored.
+    >>> idx = minMaxIndices(x, y, 1000)
+    >>> ax.plot(x[idx], y[idx])
+    """
+    if hi is None:
+        hi = len(y)
+    if hi - lo <= 4 * nBins:
+        return np.arange(lo, hi)
+    xs = x[lo:hi]
+    ys = np.asarray(y[lo:hi], dtype=np.float64)
+    edges = np.linspace(float(xs[0]), float(xs[-1]), nBins + 1)[1:-1]
+    starts = np.unique(np.concatenate(([0], np.searchsorted(xs, edges))))
+    starts = starts[starts < ys.size]
+    seg = np.repeat(np.arange(starts.size), np.diff(np.append(starts, ys.size)))
+    with np.errstate(invalid='ignore'):
+        mins = np.fmin.reduceat(ys, starts)
+        maxs = np.fmax.reduceat(ys, starts)
+    idx = np.concatenate((_firstPerSegment(ys == mins[seg], seg), _firstPerSegment(ys == maxs[seg], seg),
+                          [0, ys.size - 1]))
+    return np.unique(idx) + lo
+
+
+def lttbIndices(x, y, nOut, lo=0, hi=None):
+    """ Largest-Triangle-Three-Buckets decimation: indices of nOut samples of x[lo:hi]
+    that keep the visual shape of the line (one point per bucket).
+    """
+    if hi is None:
+        hi = len(y)
+    n = hi - lo
+    if n <= nOut or nOut < 3:
+        return np.arange(lo, hi)
+    xs = np.asarray(x[lo:hi], dtype=np.float64)
+    ys = np.asarray(y[lo:hi], dtype=np.float64)
+    edges = np.linspace(1, n - 1, nOut - 1).astype(np.intp)
+    selected = np.empty(nOut, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for b in range(nOut - 2):
+        s, e = edges[b], edges[b + 1]
+        if b + 2 < edges.size:
+            ns, ne = edges[b + 1], edges[b + 2]
+            avgx, avgy = xs[ns:ne].mean(), np.nanmean(ys[ns:ne]) if np.isfinite(ys[ns:ne]).any() else ys[a]
+        else:
+            avgx, avgy = xs[-1], ys[-1]
+        area = np.abs((xs[a] - avgx) * (ys[s:e] - ys[a]) - (xs[a] - xs[s:e]) * (avgy - ys[a]))
+        a = s + (int(np.nanargmax(area)) if np.isfinite(area).any() else 0)
+        selected[b + 1] = a
+    return selected + lo
+
+
+class LodLine(object):
+    """ Level of detail line: plots only the decimated samples (min/max per pixel column or
+    LTTB) and decimates again from the full data when the axes are zoomed or panned.
+    xy: x is not sorted (XY plot of two pens): the visible points are decimated in
+        sample order keeping the extremes of both coordinates
+    >>> lod = LodLine(ax, np.arange(len(y)), y, color='g')
+    >>> i0, i1 = indexRange(lod.x, xmin, xmax)   # exact original samples of a selection
+    """
+
+    def __init__(self, ax, x, y, method='minmax', nBins=None, xy=False, **kwargs):
+        self.ax = ax
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.method = method
+        self.nBins = nBins
+        self.xy = xy
+        self.line, = ax.plot([], [], **kwargs)
+        self.line.lod = self  # os callbacks do matplotlib guardam referencias fracas
+        self.update()
+        ax.relim()
+        ax.autoscale_view()
+        ax.callbacks.connect('xlim_changed', self.update)
+        if xy:
+            ax.callbacks.connect('ylim_changed', self.update)
+
+    def bins(self):
+        if self.nBins is not None:
+            return self.nBins
+        return max(int(self.ax.get_window_extent().width), 100)
+
+    def indices(self, xlim=None, ylim=None):
+        """ Indices of the original samples drawn for the informed limits (None: all data).
+        """
+        nBins = self.bins()
+        if self.xy:
+            return self._xyIndices(xlim, ylim, nBins)
+        lo, hi = (0, self.x.size) if xlim is None else indexRange(self.x, min(xlim), max(xlim))
+        # inclui um ponto de cada lado para a linha continuar ate a borda
+        lo, hi = max(lo - 1, 0), min(hi + 1, self.x.size)
+        if self.method == 'lttb':
+            return lttbIndices(self.x, self.y, 2 * nBins, lo, hi)
+        return minMaxIndices(self.x, self.y, nBins, lo, hi)
+
+    def _xyIndices(self, xlim, ylim, nBins):
+        if xlim is None:
+            visible = np.arange(self.x.size)
+        else:
+            with np.errstate(invalid='ignore'):
+                inside = (self.x >= min(xlim)) & (self.x <= max(xlim)) & (self.y >= min(ylim)) & (self.y <= max(ylim))
+            visible = np.flatnonzero(inside)
+        if visible.size <= 4 * nBins:
+            return visible
+        order = np.arange(visible.size, dtype=np.float64)
+        idx = np.union1d(minMaxIndices(order, self.x[visible], nBins), minMaxIndices(order, self.y[visible], nBins))
+        return visible[idx]
+
+    def update(self, ax=None):
+        """ Decimates again for the current axes limits.
+        """
+        if ax is None:
+            idx = self.indices()
+        else:
+            idx = self.indices(self.ax.get_xlim(), self.ax.get_ylim())
+        self.line.set_data(self.x[idx], self.y[idx])
+        if ax is not None:
+            self.ax.figure.canvas.draw_idle()
+
+
+def calendarHeatmap(ax, days, hours, profile, cmap='coolwarm', label=None, **kwargs):
+    """ Calendar heatmap of a day x time of day matrix (see epmProfiles.dailyProfile): one
+    image, so the drawing cost does not depend on the number of days or samples per day.
+    NaN (gaps) are left blank.
+    >>> days, hours, profile = epf.dailyProfile(epmData['Timestamp'], epmData['Value'])
+    >>> calendarHeatmap(ax, days, hours, profile, label='Power')
+    """
+    import matplotlib.dates as mdates
+    days = np.asarray(days, dtype='M8[D]')
+    step = hours[1] - hours[0] if len(hours) > 1 else 24.0
+    d0 = mdates.date2num(days[0].astype(object))
+    extent = [hours[0], hours[-1] + step, d0 + len(days), d0]
+    im = ax.imshow(np.ma.masked_invalid(profile), aspect='auto', origin='upper', extent=extent, cmap=cmap,
+                   interpolation='nearest', **kwargs)
+    ax.yaxis_date()
+    ax.set_xlabel('hour')
+    ax.set_xlim(extent[0], extent[1])
+    ax.grid(False)
+    cb = ax.figure.colorbar(im, ax=ax)
+    if label is not None:
+        cb.set_label(label)
+    return im
+
+
+def calendarHeatmapPng(days, hours, profile, fileObj=None, figsize=(15, 8), dpi=100, title=None, **kwargs):
+    """ Renders calendarHeatmap to PNG without a GUI (Agg canvas, pyplot is not used).
+    fileObj: file name or file object; None returns an io.BytesIO with the image
+    >>> buf = calendarHeatmapPng(days, hours, profile, label='Power')
+    """
+    import io
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    calendarHeatmap(ax, days, hours, profile, **kwargs)
+    if title is not None:
+        ax.set_title(title)
+    buf = io.BytesIO() if fileObj is None else fileObj
+    fig.savefig(buf, format='png')
+    if fileObj is None:
+        buf.seek(0)
+    return buf
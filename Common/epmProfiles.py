@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - daily profiles
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import datetime as dt
+from collections import OrderedDict
+import numpy as np
+import epmArray as ea
+
+
+NS_PER_HOUR = 3600 * ea.NS_PER_SECOND
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+
+def localNs(t, tz=None):
+    """ Timestamps as int64 ns on the local time of tz (wall clock), so days and hours
+    follow the daylight saving time changes.
+    tz: timezone of datetime64 (UTC) timestamps; timezone aware datetimes use their own
+    """
+    t, tzFound = ea.timestamps2datetime64(t)
+    if tz is None:
+        tz = tzFound
+    tNs = t.view(np.int64)
+    if tz is None or tNs.size == 0:
+        return tNs
+    # deslocamento calculado uma vez por hora UTC distinta (nao por amostra)
+    hours, inverse = np.unique(tNs // NS_PER_HOUR, return_inverse=True)
+    offsets = np.array([int(dt.datetime.fromtimestamp(int(h) * 3600, tz).utcoffset().total_seconds())
+                        for h in hours], dtype=np.int64) * ea.NS_PER_SECOND
+    return tNs + offsets[inverse.ravel()]
+
+
+def inferInterval(tNs):
+    """ Sampling interval (ns): median of the positive time deltas.
+    """
+    dtNs = np.diff(tNs)
+    dtNs = dtNs[dtNs > 0]
+    if dtNs.size == 0:
+        raise ValueError('Cannot infer the sampling interval from less than two distinct timestamps.')
+    return int(np.median(dtNs))
+
+
+def dailyProfile(t, y, interval=None, tz=None):
+    """ Day x time of day matrix of y (one row per local day, one column per sampling
+    interval), filled with a single scatter; slots without samples (gaps, the hour skipped
+    on daylight saving time days) are NaN and a repeated hour keeps its last sample.
+    interval: sampling interval (seconds); None infers it from the timestamps
+    Returns the days (datetime64[D]), the time of day of each column (hours) and the matrix.
+    >>> days, hours, profile = dailyProfile(epmData['Timestamp'], epmData['Value'])
+    """
+    tNs = localNs(t, tz)
+    y = np.asarray(y, dtype=np.float64)
+    if interval is None:
+        intervalNs = inferInterval(tNs)
+    else:
+        intervalNs = int(round(interval * ea.NS_PER_SECOND))
+    nSlots = max(int(round(NS_PER_DAY / float(intervalNs))), 1)
+    day = tNs // NS_PER_DAY
+    slot = np.minimum((tNs - day * NS_PER_DAY) // intervalNs, nSlots - 1)
+    firstDay = day.min() if day.size else 0
+    nDays = int(day.max() - firstDay + 1) if day.size else 0
+    profile = np.full((nDays, nSlots), np.nan)
+    profile[day - firstDay, slot] = y
+    days = (firstDay + np.arange(nDays)).astype('M8[D]')
+    hours = np.arange(nSlots) * (intervalNs / float(NS_PER_HOUR))
+    return days, hours, profile
+
+
+def typicalProfile(t, y, interval=None, byWeekday=False, tz=None, quantiles=(10, 50, 90)):
+    """ Typical day profile of y for any number of days: samples grouped by time of day
+    (slots of interval seconds; None infers the sampling interval) and, with byWeekday, by
+    day of the week (0 = Monday). The groups are reduced at once (bincount and one sort),
+    NaN samples are ignored and the input is not changed.
+    Returns a dict with 'hours' (start of each slot), 'count', 'mean', 'median' and the
+    'quantiles' dict (percentile -> values); arrays have one value per slot, or 7 rows
+    (weekdays) with byWeekday. Slots without samples are NaN.
+    >>> prof = typicalProfile(epmData['Timestamp'], epmData['Value'], interval=3600)
+    >>> plt.fill_between(prof['hours'], prof['quantiles'][10], prof['quantiles'][90])
+    """
+    tNs = localNs(t, tz)
+    y = np.asarray(y, dtype=np.float64)
+    if interval is None:
+        intervalNs = inferInterval(tNs)
+    else:
+        intervalNs = int(round(interval * ea.NS_PER_SECOND))
+    nSlots = max(int(round(NS_PER_DAY / float(intervalNs))), 1)
+    valid = ~np.isnan(y)
+    tNs, y = tNs[valid], y[valid]
+    day = tNs // NS_PER_DAY
+    key = np.minimum((tNs - day * NS_PER_DAY) // intervalNs, nSlots - 1)
+    nGroups = nSlots
+    if byWeekday:
+        key += ((day + 3) % 7) * nSlots  # 01/01/1970 foi quinta-feira
+        nGroups = 7 * nSlots
+    count = np.bincount(key, minlength=nGroups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(key, weights=y, minlength=nGroups) / count
+    # ordena por grupo e valor: percentis (interpolacao linear, como np.percentile) por indice
+    ys = y[np.lexsort((y, key))]
+    starts = np.cumsum(count) - count
+    last = np.maximum(count - 1, 0)
+    qValues = {}
+    for q in sorted(set(quantiles) | set([50])):
+        pos = last * (q / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        frac = pos - lo
+        hi = np.minimum(lo + 1, last)
+        if ys.size:
+            v = ys[np.minimum(starts + lo, ys.size - 1)] * (1.0 - frac) + ys[np.minimum(starts + hi, ys.size - 1)] * frac
+        else:
+            v = np.zeros(nGroups)
+        v[count == 0] = np.nan
+        qValues[q] = v
+    shape = (7, nSlots) if byWeekday else (nSlots,)
+    prof = OrderedDict()
+    prof['hours'] = np.arange(nSlots) * (intervalNs / float(NS_PER_HOUR))
+    prof['count'] = count.reshape(shape)
+    prof['mean'] = mean.reshape(shape)
+    prof['median'] = qValues[50].reshape(shape)
+    prof['quantiles'] = dict((q, v.reshape(shape)) for q, v in qValues.items() if q in quantiles)
+    return prof
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - descriptive statistics
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+from collections import OrderedDict
+import numpy as np
+
+
+def _playOperator(x, h, y0):
+    # Folga (backlash) de meia largura h: y[i] = clamp(y[i-1], x[i] - h, x[i] + h).
+    # A composicao de clamps e um clamp, entao a recursao vira uma varredura vetorizada
+    # por dobramento (log2(n) passos) sobre os intervalos [lo, hi] compostos.
+    if h <= 0:
+        return x.copy()
+    lo = x - h
+    hi = x + h
+    n = x.size
+    d = 1
+    while d < n:
+        newLo = np.minimum(np.maximum(lo[:-d], lo[d:]), hi[d:])
+        newHi = np.minimum(np.maximum(hi[:-d], lo[d:]), hi[d:])
+        lo[d:] = newLo
+        hi[d:] = newHi
+        d *= 2
+        if not (lo[d - 1:] < hi[d - 1:]).any():
+            break
+    return np.minimum(np.maximum(y0, lo), hi)
+
+
+class ReversalCounter(object):
+    """ Counts direction changes (reversals) of a signal, e.g. valve or actuator wear.
+    deadband: a reversal is counted only when the signal moves back more than deadband
+              from its last extreme (hysteresis), so noise inside the band is ignored
+    Plateaus (zero deltas) keep the last direction and NaN samples are skipped. The last
+    direction is carried between chunks, so chunked counting equals a single pass.
+    >>> counter = ReversalCounter(deadband=0.5)
+    >>> for chunk in chunks:
+    ...     counter.update(chunk['Value'])
+    >>> n = counter.count
+    """
+
+    def __init__(self, deadband=0.0):
+        if deadband < 0:
+            raise ValueError('Deadband must be >= 0.')
+        self.deadband = float(deadband)
+        self.count = 0
+        self.y = None  # ultima saida da folga (sinal sem o ruido da banda morta)
+        self.lastSign = 0  # ultima direcao (-1, 1 ou 0 se ainda indefinida)
+
+    def update(self, y):
+        """ Adds a chunk of values.
+        """
+        x = np.asarray(y, dtype=np.float64)
+        x = x[~np.isnan(x)]
+        if x.size == 0:
+            return self
+        if self.y is None:
+            self.y = float(x[0])
+        p = _playOperator(x, self.deadband / 2.0, self.y)
+        s = np.sign(np.diff(np.concatenate(([self.y], p))))
+        s = s[s != 0]
+        if s.size:
+            self.count += int(np.count_nonzero(s[1:] != s[:-1]))
+            if self.lastSign and s[0] != self.lastSign:
+                self.count += 1
+            self.lastSign = int(s[-1])
+        self.y = float(p[-1])
+        return self
+
+    def getState(self):
+        """ Returns the counter state as a JSON serializable dict.
+        """
+        return {'deadband': self.deadband, 'count': self.count, 'y': self.y, 'lastSign': self.lastSign}
+
+    @classmethod
+    def fromState(cls, state):
+        """ Rebuilds a counter from getState().
+        """
+        counter = cls(state['deadband'])
+        counter.count, counter.y, counter.lastSign = state['count'], state['y'], state['lastSign']
+        return counter
+
+
+def countReversals(y, deadband=0.0):
+    """ Number of direction changes of y (see ReversalCounter).
+    >>> n = countReversals(epmData['Value'], deadband=0.5)
+    """
+    return ReversalCounter(deadband).update(y).count
+
+
+# Tamanho dos blocos do kernel de estatisticas (cabem na cache do processador)
+BLOCK_SIZE = 1 << 16
+
+
+def describe(y, quantiles=(), blockSize=BLOCK_SIZE):
+    """ Descriptive statistics of y in a single pass over the data (blocks merged with
+    Chan's formulas), NaN aware: count (valid samples), nanCount, min, max, mean and std
+    (ddof=0). quantiles: percentiles (0-100) returned in the 'quantiles' dict.
+    >>> st = describe(epmData['Value'], quantiles=(10, 50, 90))
+    >>> st['mean'], st['std'], st['quantiles'][90]
+    """
+    y = np.asarray(y)
+    if y.ndim != 1:
+        y = y.reshape(-1)
+    # vistas 1-D (ex.: campo 'Value' >f8 da pena) lidas sem copia, convertidas bloco a bloco
+    count = 0
+    mean = 0.0
+    m2 = 0.0
+    vmin = np.inf
+    vmax = -np.inf
+    for i in range(0, y.size, blockSize):
+        b = np.asarray(y[i:i + blockSize], dtype=np.float64)
+        valid = ~np.isnan(b)
+        n = int(np.count_nonzero(valid))
+        if n == 0:
+            continue
+        if n < b.size:
+            b = b[valid]
+        bmin, bmax = b.min(), b.max()
+        vmin = bmin if bmin < vmin else vmin
+        vmax = bmax if bmax > vmax else vmax
+        bmean = b.mean()
+        bc = b - bmean
+        total = count + n
+        delta = bmean - mean
+        mean += delta * n / total
+        m2 += np.dot(bc, bc) + delta * delta * count * n / total
+        count = total
+    st = OrderedDict([('count', count), ('nanCount', y.size - count)])
+    if count == 0:
+        st.update([('min', np.nan), ('max', np.nan), ('mean', np.nan), ('std', np.nan)])
+    else:
+        st.update([('min', float(vmin)), ('max', float(vmax)), ('mean', float(mean)),
+                   ('std', float(np.sqrt(m2 / count)))])
+    st['quantiles'] = {}
+    if len(quantiles):
+        addQuantiles(st, y, quantiles)
+    return st
+
+
+def addQuantiles(st, y, quantiles):
+    """ Adds the missing percentiles of y to the statistics returned by describe.
+    """
+    missing = [q for q in quantiles if q not in st['quantiles']]
+    if missing:
+        y = np.asarray(y, dtype=np.float64).ravel()
+        if st['nanCount']:
+            y = y[~np.isnan(y)]
+        values = np.percentile(y, missing) if y.size else np.full(len(missing), np.nan)
+        st['quantiles'].update(zip(missing, np.atleast_1d(values).tolist()))
+    return st
+
+
+class StatsCache(object):
+    """ Cache of describe() results by pen and query range, so chained operations over
+    the same selection (statistics, remove mean, normalize, min-max...) compute them once.
+    The oldest results are dropped after maxSize entries.
+    >>> st = statsCache.get(rangeKey(pen.name, pen.values), pen.values['Value'])
+    """
+
+    def __init__(self, maxSize=32):
+        self.maxSize = maxSize
+        self._stats = OrderedDict()
+
+    def get(self, key, y, quantiles=()):
+        st = self._stats.pop(key, None)
+        if st is None:
+            st = describe(y, quantiles)
+        elif len(quantiles):
+            addQuantiles(st, y, quantiles)
+        self._stats[key] = st
+        while len(self._stats) > self.maxSize:
+            self._stats.popitem(last=False)
+        return st
+
+    def clear(self):
+        self._stats.clear()
+
+
+# Cache compartilhado pelos plugins
+statsCache = StatsCache()
+
+
+def rangeKey(name, epmData):
+    """ Cache key of a pen query: name, number of samples, first and last timestamps.
+    """
+    t = epmData['Timestamp']
+    if len(t) == 0:
+        return (name, 0, None, None)
+    return (name, len(t), str(t[0]), str(t[-1]))
+
+
+def densityGrid(arrays, bins=64, ranges=None):
+    """ Counts of the samples of N equally spaced variables in a regular grid (2-D
+    histogram, 3-D voxels...), so plots of large datasets draw bins instead of points.
+    Samples with NaN in any variable are ignored; a single bincount fills the grid.
+    bins: number of bins per axis (int or one per variable)
+    ranges: (min, max) per variable; None uses the limits of the data
+    Returns the counts (one axis per variable) and the list of bin edges.
+    >>> counts, (xe, ye) = densityGrid([x, y], bins=100)
+    >>> ax.pcolormesh(xe, ye, counts.T)
+    """
+    values = [np.asarray(a, dtype=np.float64).ravel() for a in arrays]
+    nVars = len(values)
+    if np.ndim(bins) == 0:
+        bins = [int(bins)] * nVars
+    if ranges is None:
+        ranges = [(np.nanmin(v), np.nanmax(v)) if v.size else (0.0, 1.0) for v in values]
+    edges = []
+    flat = 0
+    inside = True
+    for v, n, (lo, hi) in zip(values, bins, ranges):
+        lo, hi = float(lo), float(hi)
+        if not hi > lo:
+            lo, hi = (lo - 0.5, hi + 0.5) if hi == lo else (0.0, 1.0)
+        edges.append(np.linspace(lo, hi, n + 1))
+        with np.errstate(invalid='ignore'):
+            pos = (v - lo) * (n / (hi - lo))
+            inside = inside & (pos >= 0) & (pos <= n)  # NaN fica fora
+            # borda superior incluida no ultimo bin (como np.histogram)
+            idx = np.minimum(pos, n - 1, out=pos).astype(np.intp)
+        flat = flat * n + idx
+    counts = np.bincount(np.asarray(flat)[inside], minlength=int(np.prod(bins)))
+    return counts.reshape(bins), edges
+
+
+def corrMatrix(arrays):
+    """ Pearson correlation matrix of N equally spaced variables (samples with NaN in any
+    variable are ignored).
+    >>> r = corrMatrix([pen.Values['Value'] for pen in pens])
+    """
+    values = np.vstack([np.asarray(a, dtype=np.float64).ravel() for a in arrays])
+    values = values[:, ~np.isnan(values).any(axis=0)]
+    values -= values.mean(axis=1)[:, np.newaxis]
+    cov = np.dot(values, values.T)
+    d = np.sqrt(np.diag(cov))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return cov / np.outer(d, d)
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - time weighted statistics
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import numpy as np
+import epmArray as ea
+
+
+def timeInIntervals(t, y, nodes):
+    """ Returns the time (seconds) spent in each interval defined by nodes.
+    The period between samples i-1 and i is assigned to the interval of y[i];
+    samples with NaN values are not counted.
+    Intervals: ]-inf, nodes[0][, [nodes[0], nodes[1][, ..., [nodes[-1], inf[
+    >>> totTime = timeInIntervals(epmData['Timestamp'], epmData['Value'], [0, 20, 50, 100])
+    """
+    nodes = np.asarray(nodes, dtype=np.float64)
+    t, tz = ea.timestamps2datetime64(t)
+    y = np.asarray(y, dtype=np.float64)
+    totNs = _durationsNs(np.diff(t.view(np.int64)), y[1:], nodes)
+    return totNs / float(ea.NS_PER_SECOND)
+
+
+def _durationsNs(dtNs, y, nodes):
+    # Soma os deltas de tempo (ns) no intervalo de cada valor y, ignorando NaN
+    ix = np.digitize(y, nodes)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        ix = ix[valid]
+        dtNs = dtNs[valid]
+    totNs = np.bincount(ix, weights=dtNs, minlength=nodes.size + 1)
+    return np.round(totNs).astype(np.int64)
+
+
+def nodesPercentsTable(nodes, totTime):
+    """ Builds the [lower node, fraction of time] table returned by percentTimeIn.
+    """
+    nodesPercents = np.zeros([np.size(totTime), 2])
+    nodesPercents[0, 0] = -np.inf
+    nodesPercents[1:, 0] = nodes
+    totalPeriod = totTime.sum()
+    if totalPeriod > 0:
+        nodesPercents[:, 1] = totTime / totalPeriod
+    return nodesPercents
+
+
+def percentTimeIn(t, y, nodes):
+    """ Returns the fraction of time in each interval defined by nodes.
+    Each row is [lower node, fraction], the first lower node is -inf.
+    >>> nodesPercents = percentTimeIn(t, y, range(0, 360, 45))
+    """
+    nodes = np.asarray(nodes, dtype=np.float64)
+    return nodesPercentsTable(nodes, timeInIntervals(t, y, nodes))
+
+
+class TimeInIntervalsAccumulator(object):
+    """ Streaming and mergeable version of timeInIntervals.
+    Chunks must be informed in time order; the period between the last sample of a
+    chunk and the first one of the next chunk is counted as in a single pass.
+    The state can be saved in session.userCache (EPM Processor) to update the
+    statistics incrementally.
+    >>> acc = TimeInIntervalsAccumulator([0, 20, 50, 100])
+    >>> acc.update(epmData['Timestamp'], epmData['Value'])
+    >>> session.userCache['percentTime'] = json.dumps(acc.getState())
+    >>> acc = TimeInIntervalsAccumulator.fromState(json.loads(session.userCache['percentTime']))
+    >>> nodesPercents = acc.percents()
+    """
+
+    def __init__(self, nodes):
+        self.nodes = np.asarray(nodes, dtype=np.float64)
+        self.totNs = np.zeros(self.nodes.size + 1, dtype=np.int64)
+        self.firstNs = None  # timestamp (ns) da primeira amostra
+        self.firstBin = -1  # intervalo da primeira amostra (-1 se NaN)
+        self.lastNs = None  # timestamp (ns) da ultima amostra
+
+    def update(self, t, y):
+        """ Adds a chunk of samples (timestamps and values).
+        """
+        t, tz = ea.timestamps2datetime64(t)
+        y = np.asarray(y, dtype=np.float64)
+        if y.size == 0:
+            return self
+        tNs = t.view(np.int64)
+        if self.lastNs is None:
+            self.firstNs = int(tNs[0])
+            self.firstBin = self._bin(y[0])
+            self.totNs += _durationsNs(np.diff(tNs), y[1:], self.nodes)
+        else:
+            if tNs[0] < self.lastNs:
+                raise ValueError('Chunks must be informed in time order.')
+            dtNs = np.diff(np.concatenate(([self.lastNs], tNs)))
+            self.totNs += _durationsNs(dtNs, y, self.nodes)
+        self.lastNs = int(tNs[-1])
+        return self
+
+    def merge(self, other, bridge=True):
+        """ Merges the partial result of another accumulator with the same nodes.
+        Partial results must be merged in time order: other must start at or after the
+        last sample of this accumulator (overlapping or earlier periods would count the
+        same time twice and raise ValueError).
+        bridge: counts the gap between the two periods as in a single pass
+        """
+        if not np.array_equal(self.nodes, other.nodes):
+            raise ValueError('Accumulators must have the same nodes.')
+        if other.lastNs is None:
+            return self
+        if self.lastNs is None:
+            self.totNs[:] = other.totNs
+            self.firstNs, self.firstBin, self.lastNs = other.firstNs, other.firstBin, other.lastNs
+            return self
+        if other.firstNs < self.lastNs:
+            raise ValueError('Accumulators must be merged in time order (other must start after this one ends).')
+        self.totNs += other.totNs
+        if bridge and other.firstBin >= 0:
+            self.totNs[other.firstBin] += other.firstNs - self.lastNs
+        self.lastNs = other.lastNs
+        return self
+
+    def totTime(self):
+        """ Time (seconds) spent in each interval.
+        """
+        return self.totNs / float(ea.NS_PER_SECOND)
+
+    def percents(self):
+        """ Same [lower node, fraction] table returned by percentTimeIn.
+        """
+        return nodesPercentsTable(self.nodes, self.totTime())
+
+    def getState(self):
+        """ Returns the accumulator state as a JSON serializable dict.
+        """
+        return {'nodes': self.nodes.tolist(), 'totNs': self.totNs.tolist(), 'firstNs': self.firstNs,
+                'firstBin': self.firstBin, 'lastNs': self.lastNs}
+
+    @classmethod
+    def fromState(cls, state):
+        """ Rebuilds an accumulator from getState().
+        """
+        acc = cls(state['nodes'])
+        acc.totNs[:] = state['totNs']
+        acc.firstNs, acc.firstBin, acc.lastNs = state['firstNs'], state['firstBin'], state['lastNs']
+        return acc
+
+    def _bin(self, v):
+        if np.isnan(v):
+            return -1
+        return int(np.digitize([v], self.nodes)[0])
+
+
+# Unidades de tempo da integracao: segundos por unidade (ex.: kW integrado em 'h' = kWh)
+TIME_UNITS = {'s': 1.0, 'min': 60.0, 'h': 3600.0, 'd': 86400.0}
+
+
+def _validSamples(t, y):
+    # Timestamps (ns) e valores sem as amostras NaN
+    t, tz = ea.timestamps2datetime64(t)
+    tNs = t.view(np.int64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    if not valid.all():
+        tNs = tNs[valid]
+        y = y[valid]
+    return tNs, y
+
+
+def _unitSeconds(unit):
+    if unit not in TIME_UNITS:
+        raise ValueError('unit must be one of: ' + ', '.join(sorted(TIME_UNITS)))
+    return TIME_UNITS[unit]
+
+
+def integrate(t, y, method='trapezoid', unit='s'):
+    """ Integral of y over the real timestamps (int64 ns deltas); NaN samples are skipped.
+    method: 'trapezoid' or 'simpson' (non uniform Simpson over pairs of intervals; with an
+            odd number of intervals the last one uses the trapezoid rule)
+    unit: time unit of the result ('s', 'min', 'h' or 'd'), e.g. kWh from a kW pen with 'h'
+    >>> energy = integrate(epmData['Timestamp'], epmData['Value'], unit='h')
+    """
+    tNs, y = _validSamples(t, y)
+    if y.size < 2:
+        return 0.0
+    h = np.diff(tNs) / (float(ea.NS_PER_SECOND) * _unitSeconds(unit))
+    if method == 'trapezoid':
+        return float(np.dot(h, (y[1:] + y[:-1]) / 2.0))
+    elif method != 'simpson':
+        raise ValueError("method must be 'trapezoid' or 'simpson'.")
+    nPairs = h.size // 2
+    h0 = h[0:2 * nPairs:2]
+    h1 = h[1:2 * nPairs:2]
+    y0 = y[0:2 * nPairs:2]
+    y1 = y[1:2 * nPairs + 1:2]
+    y2 = y[2:2 * nPairs + 1:2]
+    hs = h0 + h1
+    with np.errstate(invalid='ignore', divide='ignore'):
+        area = hs / 6.0 * ((2.0 - h1 / h0) * y0 + hs * hs / (h0 * h1) * y1 + (2.0 - h0 / h1) * y2)
+    # intervalos de duracao zero (timestamps repetidos): trapezio
+    bad = ~np.isfinite(area)
+    if bad.any():
+        area[bad] = (h0[bad] * (y0[bad] + y1[bad]) + h1[bad] * (y1[bad] + y2[bad])) / 2.0
+    total = area.sum()
+    if h.size % 2:
+        total += h[-1] * (y[-1] + y[-2]) / 2.0
+    return float(total)
+
+
+def cumulativeIntegral(t, y, unit='s', initial=0.0):
+    """ Running integral (trapezoid rule) at each sample, e.g. an energy pen from a
+    power pen; NaN samples keep the running total.
+    >>> energy = cumulativeIntegral(epmData['Timestamp'], epmData['Value'], unit='h')
+    """
+    return Integrator(unit, initial).update(t, y)
+
+
+class Integrator(object):
+    """ Chunked time integral (trapezoid rule): update() returns the running total at
+    each sample of the chunk and carries the last sample and the total to the next call.
+    The state can be saved in session.userCache (EPM Processor) to totalize months of
+    data incrementally.
+    >>> energy = Integrator('h')
+    >>> for chunk in chunks:
+    ...     cumulative = energy.update(chunk['Timestamp'], chunk['Value'])
+    >>> session.userCache['energy'] = json.dumps(energy.getState())
+    """
+
+    def __init__(self, unit='s', initial=0.0):
+        self.unit = unit
+        self.scale = 1.0 / (float(ea.NS_PER_SECOND) * _unitSeconds(unit))
+        self.total = float(initial)
+        self.lastNs = None  # timestamp (ns) da ultima amostra valida
+        self.lastY = None  # valor da ultima amostra valida
+
+    def update(self, t, y):
+        """ Adds a chunk of samples and returns the running integral at each sample.
+        """
+        y = np.asarray(y, dtype=np.float64)
+        t, tz = ea.timestamps2datetime64(t)
+        tNs = t.view(np.int64)
+        valid = ~np.isnan(y)
+        tv, yv = tNs[valid], y[valid]
+        if yv.size == 0:
+            return np.full(y.size, self.total)
+        if self.lastNs is not None:
+            if tv[0] < self.lastNs:
+                raise ValueError('Chunks must be informed in time order.')
+            tv = np.concatenate(([self.lastNs], tv))
+            yv = np.concatenate(([self.lastY], yv))
+        else:
+            tv = np.concatenate((tv[:1], tv))
+            yv = np.concatenate((yv[:1], yv))
+        areas = np.diff(tv) * self.scale * (yv[1:] + yv[:-1]) / 2.0
+        cumulative = self.total + np.cumsum(areas)
+        if not valid.all():
+            # amostras NaN mantem o total da ultima amostra valida
+            pos = np.cumsum(valid) - 1
+            cumulative = np.where(pos >= 0, cumulative[np.maximum(pos, 0)], self.total)
+        self.total = float(cumulative[-1])
+        self.lastNs, self.lastY = int(tv[-1]), float(yv[-1])
+        return cumulative
+
+    def getState(self):
+        """ Returns the integrator state as a JSON serializable dict.
+        """
+        return {'unit': self.unit, 'total': self.total, 'lastNs': self.lastNs, 'lastY': self.lastY}
+
+    @classmethod
+    def fromState(cls, state):
+        """ Rebuilds an integrator from getState().
+        """
+        integrator = cls(state['unit'], state['total'])
+        integrator.lastNs, integrator.lastY = state['lastNs'], state['lastY']
+        return integrator
@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+'''Elipse Plant Manager - EPM Dataset Analysis - wind turbine analysis
+
+Copyright (C) 2018 Elipse Software.
+Distributed under the MIT License.
+(See accompanying file LICENSE.txt or copy at http://opensource.org/licenses/MIT)
+'''
+
+import io
+import os
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+import scipy.optimize as optimize
+from scipy import interpolate
+import epmArray as ea
+
+
+# Parametros iniciais da curva de potencia (powerFitPn4)
+PAR0 = [1.0, 1.0, 1500.0, 1.0]
+
+# Tabela de parametros ajustados por aerogerador (fitPowerCurves)
+FIT_DTYPE = np.dtype([('Turbine', 'object'), ('par', 'f8', (4,)), ('rmse', 'f8'), ('nBins', 'i8'), ('ier', 'i4')])
+
+
+class SpeedPowerCleaner(object):
+    """ Cleaning pipeline for speed x power data: all rules are combined into a single
+    boolean mask (no intermediate copies of the data) and the number of samples
+    dropped by each rule is kept in report (in rule order, each sample is counted
+    only by the first rule that drops it).
+    Default rules: nan, negativePower, overNominalPower and minSpeed.
+    >>> cleaner = SpeedPowerCleaner(minSpeed=4.0, nominalPower=3000.0)
+    >>> speed, power = cleaner.apply(rawSpeed, rawPower)
+    >>> print(cleaner.report)
+    >>> cleaner.addRule('maxSpeed', lambda speed, power: speed > 25.0)
+    """
+
+    def __init__(self, minSpeed=4.0, nominalPower=3000.0):
+        self.minSpeed = minSpeed
+        self.nominalPower = nominalPower
+        self.rules = OrderedDict()
+        self.addRule('nan', lambda speed, power: np.isnan(speed) | np.isnan(power))
+        self.addRule('negativePower', lambda speed, power: power < 0.)
+        self.addRule('overNominalPower', lambda speed, power: power > self.nominalPower)
+        self.addRule('minSpeed', lambda speed, power: speed < self.minSpeed)
+        self.report = OrderedDict()
+
+    def addRule(self, name, rule):
+        """ Adds (or replaces) a rule: rule(speed, power) returns True for the samples to drop.
+        """
+        self.rules[name] = rule
+        return self
+
+    def removeRule(self, name):
+        del self.rules[name]
+        return self
+
+    def mask(self, speed, power):
+        """ Returns the boolean mask of the samples to keep and updates report.
+        """
+        speed = np.asarray(speed, dtype=np.float64)
+        power = np.asarray(power, dtype=np.float64)
+        keep = np.ones(speed.shape, dtype=bool)
+        self.report = OrderedDict()
+        with np.errstate(invalid='ignore'):
+            for name, rule in self.rules.items():
+                drop = rule(speed, power)
+                np.logical_and(drop, keep, out=drop)
+                self.report[name] = int(np.count_nonzero(drop))
+                keep ^= drop
+        return keep
+
+    def apply(self, speed, power):
+        """ Returns the clean speed and power vectors.
+        """
+        keep = self.mask(speed, power)
+        return np.asarray(speed)[keep], np.asarray(power)[keep]
+
+
+def windPowerAverage(speed, power, binSpeed=None):
+    """ Calculates the power average for each speed value.
+    binSpeed: if informed, averages by fixed width speed bins (see methodOfBins)
+    Samples with NaN speed or power are ignored.
+    >>> speedAvg, powerAvg = windPowerAverage(speed, power)
+    >>> speedAvg, powerAvg = windPowerAverage(speed, power, binSpeed=0.5)
+    """
+    if binSpeed is not None:
+        speedBins, count, speedMean, powerMean, powerStd = methodOfBins(speed, power, binSpeed)
+        return speedMean, powerMean
+    speed, power = _validPairs(speed, power)
+    pos = np.argsort(speed, kind='mergesort')
+    x = speed[pos]
+    y = power[pos]
+    if x.size == 0:
+        return x, y
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(x)) + 1))
+    count = np.diff(np.append(starts, x.size))
+    return x[starts], np.add.reduceat(y, starts) / count
+
+
+def methodOfBins(speed, power, binSpeed=0.5, ddof=0):
+    """ IEC 61400-12 method of bins: groups the samples in speed bins of width binSpeed
+    centered on multiples of binSpeed and returns, for each non empty bin, the bin center,
+    number of samples, mean speed, mean power and power standard deviation.
+    >>> speedBins, count, speedMean, powerMean, powerStd = methodOfBins(speed, power, 0.5)
+    """
+    speed, power = _validPairs(speed, power)
+    ix = np.floor(speed / binSpeed + 0.5).astype(np.int64)
+    if ix.size == 0:
+        empty = np.zeros(0)
+        return empty, np.zeros(0, dtype=np.int64), empty, empty, empty
+    offset = ix.min()
+    ix -= offset
+    count = np.bincount(ix)
+    used = count > 0
+    n = np.maximum(count, 1)
+    speedMean = np.bincount(ix, weights=speed) / n
+    powerMean = np.bincount(ix, weights=power) / n
+    sqDev = np.bincount(ix, weights=(power - powerMean[ix]) ** 2)
+    powerVar = sqDev / np.maximum(count - ddof, 1)
+    powerStd = np.where(count > ddof, np.sqrt(powerVar), np.nan)
+    speedBins = (np.arange(count.size) + offset) * binSpeed
+    return speedBins[used], count[used], speedMean[used], powerMean[used], powerStd[used]
+
+
+def powerFitPn4(par, x):
+    """ Theoretical Speed x Power curve (estimates also the nominal power)
+        power = par[2] / (par[3] + exp(-(par[0] * speed + par[1])))
+    """
+    with np.errstate(over='ignore'):
+        return par[2] / (par[3] + np.exp(-(par[0] * x + par[1])))
+
+
+def powerFitPn4Jacobian(par, x, y=None):
+    """ Analytic Jacobian of powerFitPn4 (n x 4), used by fitPowerCurve.
+    """
+    with np.errstate(over='ignore', invalid='ignore'):
+        e = np.exp(-(par[0] * x + par[1]))
+        den = par[3] + e
+        dc = 1.0 / den
+        dd = -par[2] * dc * dc
+        db = -dd * e
+        jac = np.column_stack((db * x, db, dc, dd))
+    return jac
+
+
+def _residualsPn4(par, x, y):
+    return powerFitPn4(par, x) - y
+
+
+def fitPowerCurve(speed, power, par0=None, binSpeed=None):
+    """ Fits powerFitPn4 to the averaged speed x power data (see windPowerAverage).
+    par0: initial parameters (default PAR0, or the last fitted parameters of the turbine)
+    >>> parest = fitPowerCurve(speed, power)
+    >>> powerEst = powerFitPn4(parest, speedEst)
+    """
+    return _fitPowerCurve(speed, power, par0, binSpeed)[0]
+
+
+def _fitPowerCurve(speed, power, par0=None, binSpeed=None):
+    if par0 is None:
+        par0 = PAR0
+    xm, ym = windPowerAverage(speed, power, binSpeed)
+    if xm.size < len(par0):
+        return np.full(len(par0), np.nan), np.nan, xm.size, 0
+    with np.errstate(over='ignore', invalid='ignore'):
+        parest, ier = optimize.leastsq(_residualsPn4, par0, args=(xm, ym), Dfun=powerFitPn4Jacobian)
+        rmse = np.sqrt(np.mean(_residualsPn4(parest, xm, ym) ** 2))
+    return parest, rmse, xm.size, ier
+
+
+def _fitWorker(args):
+    return _fitPowerCurve(*args)
+
+
+def fitPowerCurves(turbines, lastParams=None, binSpeed=None, processes=None):
+    """ Fits the power curve of many turbines in parallel (process pool).
+    turbines: dict (or list of pairs) turbine name -> (speed, power)
+    lastParams: warm start - dict name -> parameters or a table returned by a previous call
+    processes: number of processes (None: number of CPUs, 1: runs in this process)
+    Returns a table (FIT_DTYPE) with the fitted parameters of each turbine; nBins is the
+    number of averaged speed bins (points) used in the fit, not the number of samples.
+    >>> fitTable = fitPowerCurves({'WTG01': (speed1, power1), 'WTG02': (speed2, power2)})
+    >>> fitTable = fitPowerCurves(newData, lastParams=fitTable)
+    """
+    if isinstance(turbines, dict):
+        turbines = list(turbines.items())
+    if lastParams is None:
+        lastParams = {}
+    elif isinstance(lastParams, np.ndarray):
+        lastParams = dict(zip(lastParams['Turbine'], lastParams['par']))
+    tasks = []
+    for name, (speed, power) in turbines:
+        par0 = lastParams.get(name)
+        if par0 is None or np.isnan(par0).any():
+            par0 = PAR0
+        tasks.append((speed, power, list(par0), binSpeed))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(tasks))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_fitWorker, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_fitWorker(task) for task in tasks]
+    fitTable = np.zeros(len(tasks), dtype=FIT_DTYPE)
+    for i, ((name, data), (parest, rmse, nBins, ier)) in enumerate(zip(turbines, results)):
+        fitTable[i] = (name, parest, rmse, nBins, ier)
+    return fitTable
+
+
+class RefCurve(object):
+    """ Supplier speed x power curve: spline interpolation precomputed on a fine speed
+    grid, so evaluating it at any number of speeds is a vectorized linear interpolation.
+    Outside the supplier speed range the curve returns NaN.
+    >>> refCurve = RefCurve(speedRaw, powerRaw)
+    >>> powerRef = refCurve(speed)
+    >>> speedRef, powerRef = refCurve.grid(0.5)
+    """
+
+    def __init__(self, speedRaw, powerRaw, gridStep=0.01):
+        pos = np.argsort(speedRaw)
+        self.speedRaw = np.asarray(speedRaw, dtype=np.float64)[pos]
+        self.powerRaw = np.asarray(powerRaw, dtype=np.float64)[pos]
+        self.speedMin = self.speedRaw[0]
+        self.speedMax = self.speedRaw[-1]
+        tckRef = interpolate.splrep(self.speedRaw, self.powerRaw, s=0)
+        nGrid = int(np.ceil((self.speedMax - self.speedMin) / gridStep)) + 1
+        self.speedGrid = np.linspace(self.speedMin, self.speedMax, nGrid)
+        self.powerGrid = interpolate.splev(self.speedGrid, tckRef, der=0)
+
+    def __call__(self, speed):
+        return np.interp(speed, self.speedGrid, self.powerGrid, left=np.nan, right=np.nan)
+
+    def grid(self, binSpeed=0.5):
+        """ Reference curve sampled each binSpeed (same as the old genRefCurve).
+        """
+        speedRef = np.arange(self.speedMin, self.speedMax, binSpeed)
+        return speedRef, self(speedRef)
+
+
+class RefCurveRegistry(object):
+    """ Cache of supplier curves by turbine model and file; a curve is read and
+    interpolated again only when its file is modified.
+    >>> refCurve = refCurves.get(supplierCurveFile, model='3MW')
+    """
+
+    def __init__(self, gridStep=0.01):
+        self.gridStep = gridStep
+        self._curves = {}
+
+    def get(self, fileName, model=None, delimiter=';'):
+        if model is None:
+            model = os.path.basename(fileName)
+        key = (model, os.path.abspath(fileName))
+        mtime = os.path.getmtime(fileName)
+        cached = self._curves.get(key)
+        if cached is None or cached[0] != mtime:
+            speedRaw, powerRaw = readCurveCsv(fileName, delimiter)
+            cached = (mtime, RefCurve(speedRaw, powerRaw, self.gridStep))
+            self._curves[key] = cached
+        return cached[1]
+
+    def clear(self):
+        self._curves.clear()
+
+
+# Registro compartilhado pelos plugins
+refCurves = RefCurveRegistry()
+
+
+def getRefCurve(fileName, model=None, delimiter=';'):
+    """ Returns the supplier curve of fileName from the shared registry (refCurves).
+    >>> speedRef, powerRef = getRefCurve(supplierCurveFile).grid(0.5)
+    """
+    return refCurves.get(fileName, model, delimiter)
+
+
+def readCurveCsv(fileName, delimiter=';'):
+    """ Reads a two columns CSV file (decimal point or comma) and returns two numpy arrays.
+    """
+    with io.open(fileName, 'r') as f:
+        text = f.read()
+    if delimiter != ',':
+        text = text.replace(',', '.')
+    rawData = np.loadtxt(io.StringIO(text), delimiter=delimiter, ndmin=2)
+    return rawData[:, 0], rawData[:, 1]
+
+
+# Rotulos das direcoes para 4, 8 e 16 setores (demais: angulo central em graus)
+CARDINAL_LABELS = {4: ['N', 'E', 'S', 'W'],
+                   8: ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'],
+                   16: ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                        'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']}
+
+_sectorLuts = {}
+
+
+def sectorCenters(nSectors=8):
+    """ Center angle (degrees) of each compass sector.
+    """
+    return np.arange(nSectors) * (360.0 / nSectors)
+
+
+def sectorLabels(nSectors=8):
+    """ Lookup table with the label of each compass sector plus '' for invalid directions
+    (index nSectors), so labels[sector] works for any result of compassSectors.
+    """
+    lut = _sectorLuts.get(nSectors)
+    if lut is None:
+        labels = CARDINAL_LABELS.get(nSectors)
+        if labels is None:
+            labels = ['%g' % c for c in sectorCenters(nSectors)]
+        lut = np.array(labels + [''], dtype=object)
+        _sectorLuts[nSectors] = lut
+    return lut
+
+
+def compassSectors(degrees, nSectors=8):
+    """ Classifies directions (degrees, any value - wrap around 360) in nSectors compass
+    sectors centered on 0 (N): sector k is [k*w - w/2, k*w + w/2[, w = 360/nSectors.
+    NaN or infinite directions get the index nSectors.
+    Returns the sector indices and the labels lookup table (see sectorLabels).
+    >>> sector, labels = compassSectors(epmData['Value'], 16)
+    >>> dirLabels = labels[sector]
+    """
+    deg = np.asarray(degrees, dtype=np.float64)
+    width = 360.0 / nSectors
+    with np.errstate(invalid='ignore'):
+        sector = np.floor(np.mod(deg + width / 2.0, 360.0) / width)
+        sector = np.where(np.isfinite(deg), np.minimum(sector, nSectors - 1), nSectors).astype(np.intp)
+    return sector, sectorLabels(nSectors)
+
+
+# Limites das classes de velocidade da rosa dos ventos [m/s]
+SPEED_NODES = [2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 15.0, 20.0, 25.0]
+
+
+class WindRose(object):
+    """ Wind rose: direction sector x speed class matrices of time, number of samples,
+    mean speed and mean power, filled in a single vectorized pass per chunk.
+    Speed class k is [speedNodes[k-1], speedNodes[k][ (first ]-inf, speedNodes[0][, last
+    [speedNodes[-1], inf[). With timestamps, each sample weights the time since the previous
+    one (as percentTimeIn), otherwise each sample weights 1.
+    Roses can be updated chunk by chunk (in time order) and merged (e.g. site = sum of turbines).
+    >>> rose = WindRose(16).update(direction, speed, power, t)
+    >>> fractions = rose.timeFractions()        # nSectors x nClasses
+    >>> sectorFractions = rose.timeFractions().sum(axis=1)
+    >>> site = WindRose(16).merge(roseWTG01).merge(roseWTG02)
+    """
+
+    def __init__(self, nSectors=8, speedNodes=SPEED_NODES):
+        self.nSectors = nSectors
+        self.speedNodes = np.asarray(speedNodes, dtype=np.float64)
+        shape = (nSectors, self.speedNodes.size + 1)
+        self.weight = np.zeros(shape)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.speedSum = np.zeros(shape)
+        self.powerSum = np.zeros(shape)
+        self.lastNs = None
+
+    def update(self, direction, speed=None, power=None, t=None):
+        """ Adds a chunk of aligned direction, speed, power and timestamp vectors (speed,
+        power and t are optional). Samples with NaN in any informed vector are ignored.
+        Chunks with timestamps must be informed in time order.
+        """
+        sector, labels = compassSectors(direction, self.nSectors)
+        valid = sector < self.nSectors
+        nClasses = self.speedNodes.size + 1
+        if speed is not None:
+            speed = np.asarray(speed, dtype=np.float64)
+            valid &= ~np.isnan(speed)
+            flat = sector * nClasses + np.digitize(speed, self.speedNodes)
+        else:
+            flat = sector * nClasses
+        if power is not None:
+            power = np.asarray(power, dtype=np.float64)
+            valid &= ~np.isnan(power)
+        if t is not None:
+            t, tz = ea.timestamps2datetime64(t)
+            tNs = t.view(np.int64)
+            if tNs.size == 0:
+                return self
+            prevNs = tNs[0] if self.lastNs is None else self.lastNs
+            if tNs[0] < prevNs:
+                raise ValueError('Chunks must be informed in time order.')
+            weight = np.diff(np.concatenate(([prevNs], tNs))) / float(ea.NS_PER_SECOND)
+            self.lastNs = int(tNs[-1])
+        else:
+            weight = None
+        if not valid.all():
+            flat = flat[valid]
+            weight = weight[valid] if weight is not None else None
+            speed = speed[valid] if speed is not None else None
+            power = power[valid] if power is not None else None
+        size = self.count.size
+        count = np.bincount(flat, minlength=size)
+        self.count += count.reshape(self.count.shape)
+        if weight is None:
+            self.weight += count.reshape(self.count.shape)
+        else:
+            self.weight += np.bincount(flat, weights=weight, minlength=size).reshape(self.count.shape)
+        if speed is not None:
+            self.speedSum += np.bincount(flat, weights=speed, minlength=size).reshape(self.count.shape)
+        if power is not None:
+            self.powerSum += np.bincount(flat, weights=power, minlength=size).reshape(self.count.shape)
+        return self
+
+    def merge(self, other):
+        """ Adds the results of another rose with the same sectors and speed classes.
+        """
+        if self.nSectors != other.nSectors or not np.array_equal(self.speedNodes, other.speedNodes):
+            raise ValueError('Wind roses must have the same sectors and speed classes.')
+        self.weight += other.weight
+        self.count += other.count
+        self.speedSum += other.speedSum
+        self.powerSum += other.powerSum
+        if other.lastNs is not None:
+            self.lastNs = other.lastNs if self.lastNs is None else max(self.lastNs, other.lastNs)
+        return self
+
+    def timeFractions(self):
+        """ Fraction of time (or of samples) in each sector x speed class.
+        """
+        total = self.weight.sum()
+        return self.weight / total if total > 0 else np.zeros(self.weight.shape)
+
+    def meanSpeed(self, axis=None):
+        """ Mean speed per sector x speed class (axis=1: per sector).
+        """
+        return self._mean(self.speedSum, axis)
+
+    def meanPower(self, axis=None):
+        """ Mean power per sector x speed class (axis=1: per sector).
+        """
+        return self._mean(self.powerSum, axis)
+
+    def _mean(self, total, axis):
+        count = self.count
+        if axis is not None:
+            total = total.sum(axis=axis)
+            count = count.sum(axis=axis)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+
+def _validPairs(speed, power):
+    speed = np.asarray(speed, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+    valid = ~(np.isnan(speed) | np.isnan(power))
+    if not valid.all():
+        speed = speed[valid]
+        power = power[valid]
+    return speed, power
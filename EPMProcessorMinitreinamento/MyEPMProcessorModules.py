@@ -42,12 +42,16 @@ import epmprocessor as epr
 import epmwebapi as epm
 # ****** </Import dos Módulos do EPM Processor> ******
 
+# EPM arrays nativos (Common/epmArray.py)
+import epmArray as ea
+
 
 #### ***** <Configurações globais> *****
 _SERVERMACHINE = False  # Indica se é para rodar no servidor (=True)
 _PRINTDEBUG = True  # Indica se é para imprimir outputs em modo de depuração
 _USEREPOSITORY = True  # indica se é para usar o repositório do EPM Webserver ao invés de arquivos no disco
 _PHANTOMPATH = r'C:\Programas\phantomjs\bin\phantomjs.exe'  # local onde está instalado o phantomjs
+_EPMDTYPE = np.dtype([('Value', '>f8'), ('Timestamp', 'object'), ('Quality', 'i4')])  # formato de escrita no EPM
 #### ***** </Configurações globais> *****
 
 
@@ -354,6 +358,10 @@ def mspRobustLinearRegression(session, tag, predTag):
         interpData = tag.historyReadAggregate(aggInterpDetails, queryPeriod)
     except:
         raise MyExceptionClass(u'oops! Erro na interpolação!')
+    try:
+        interpData = ea.asEpmArray(interpData)
+    except:
+        raise MyExceptionClass(u'oops! Erro na conversão dos dados interpolados!')
     if len(interpData) < 2:
         session.usercache['infos'] = json.dumps({"processIntervalSeconds": processIntervalSec,
                                                  "nSamples": nSamples, "fitInfos": "NO DATA TO FIT!"})
@@ -369,13 +377,9 @@ def mspRobustLinearRegression(session, tag, predTag):
     nSamplesPred = 60*predPeriod//processIntervalSec
     timeDeltaPred = np.linspace(timeDelta[-1],2*(nSamplesPred+timeDelta[-1]), nSamplesPred).reshape(nSamplesPred, 1)
     predData = model_ransac.predict(timeDeltaPred)
-    desc = np.dtype([('Value', '>f8'), ('Timestamp', 'object'), ('Quality', 'i4')])
-    epmPredData = np.empty(nSamplesPred, dtype=desc)
-    epmPredData['Value'] = predData
-    epmPredData['Quality'] = 0
     delta = datetime.timedelta(seconds=processIntervalSec)
     predTimestamp = np.arange(endTime+delta, 31*delta+endTime, delta)
-    epmPredData['Timestamp'] = predTimestamp
+    epmPredData = ea.vec2epm(predTimestamp, predData, dtype=_EPMDTYPE)
     printOutput4Debug('Antes do W len(PredData): {}'.format(len(epmPredData['Value'])))
     try:
         if session.scopeContext == epr.ScopeContext.Test:
@@ -7,11 +7,12 @@ Distributed under the MIT License.
 
 # Numpy, Scipy and Matplotlib modules
 import numpy as np
-import scipy.optimize as optimize
-from scipy import interpolate
 from scipy import integrate
 import matplotlib.pyplot as plt
 
+# Modulos compartilhados (Common)
+import epmWind as ew
+
 
 def removeOutliers(epmSpeed, epmPower, minSpeed, nominalPower):
     """ Removes outliers from data.
@@ -20,40 +21,29 @@ def removeOutliers(epmSpeed, epmPower, minSpeed, nominalPower):
     >>> plt.show()
     """
     
-    speedData = epmSpeed['Value'].copy()
-    powerData = epmPower['Value'].copy()
-    pPos = np.argwhere(powerData < 0.)
-    speed = np.delete(speedData,pPos)
-    power = np.delete(powerData,pPos)
-    pPos = np.argwhere(powerData > nominalPower)
-    speed = np.delete(speed,pPos)
-    power = np.delete(power,pPos)
-    pPos = np.argwhere(speed < minSpeed)
-    speed = np.delete(speed,pPos)
-    power = np.delete(power,pPos)
-    return speed, power
-
-
-def windPowerAverage(speed, power):
-    """ Calculates the power average for each speed value.
+    cleaner = ew.SpeedPowerCleaner(minSpeed, nominalPower)
+    return cleaner.apply(epmSpeed['Value'], epmPower['Value'])
+
+
+def windPowerAverage(speed, power, binSpeed = None):
+    """ Calculates the power average for each speed value (or speed bin if binSpeed is informed).
     >>> speedAvg, powerAvg = windPowerAverage(speed, power)
     >>> plt.scatter(speed, power, c='b')
     >>> plt.scatter(speedAvg, powerAvg, c='r', alpha=0.5)
     >>> plt.show()
     """
 
-    pos = np.argsort(speed)
-    x = speed[pos].copy()
-    y = power[pos].copy()
-    xm = []
-    ym = []
-    i = 0
-    while i < (len(x)):
-        p = np.where(x == x[i])
-        xm.append(x[p].mean())
-        ym.append(y[p].mean())
-        i = p[0][-1] + 1
-    return np.array(xm), np.array(ym)
+    return ew.windPowerAverage(speed, power, binSpeed)
+
+
+def methodOfBins(speed, power, binSpeed = 0.5):
+    """ IEC 61400-12 method of bins: count, mean speed, mean power and power std for each speed bin.
+    >>> speedBins, count, speedMean, powerMean, powerStd = methodOfBins(speed, power, binSpeed = 0.5)
+    >>> plt.errorbar(speedMean, powerMean, yerr=powerStd, fmt='o')
+    >>> plt.show()
+    """
+
+    return ew.methodOfBins(speed, power, binSpeed)
 
 
 def bestFitSpeedPower(speedAvg, powerAvg, binSpeed = 0.5):
@@ -63,18 +53,26 @@ def bestFitSpeedPower(speedAvg, powerAvg, binSpeed = 0.5):
     >>> plt.show()
     """
 
-    par0 = [1500.0, 1.0, 1.0, 1.0]
-    old_settings = np.seterr(all='ignore')
-    parest,cov,infodict,mesg,ier = optimize.leastsq(residualsSP, par0, args=(speedAvg, powerAvg), full_output=True)
+    parest = ew.fitPowerCurve(speedAvg, powerAvg)
     speedEst = np.arange(speedAvg.min(), speedAvg.max(), binSpeed)
-    powerEst = powerFit(parest, speedEst)
+    powerEst = ew.powerFitPn4(parest, speedEst)
     return speedEst, powerEst
 
 
+def bestFitFleet(turbines, lastParams = None, processes = None):
+    """ Fits the power curve of many turbines in parallel and returns a parameters table.
+    >>> fitTable = bestFitFleet({'WTG01': (speed1, power1), 'WTG02': (speed2, power2)})
+    >>> fitTable = bestFitFleet(newTurbinesData, lastParams = fitTable)
+    >>> powerEst = ew.powerFitPn4(fitTable['par'][0], speedEst)
+    """
+
+    return ew.fitPowerCurves(turbines, lastParams = lastParams, processes = processes)
+
+
 def powerFit(par, x):
     """ Theoretical Speed x Power curve
         power = par[0] / (par[1] + exp-(par[2] * speed + par[3]))
-    Used by bestFitSpeedPower and residualsSP.
+    Same model as epmWind.powerFitPn4 (used by bestFitSpeedPower) with the parameters in another order.
     """
 
     return par[0] / (par[1] + np.exp(-(par[2] * x + par[3])))
@@ -82,7 +80,6 @@ def powerFit(par, x):
 
 def residualsSP(par, x, y):
     """ Calculates the residuals based on experimental data.
-    Used by bestFitSpeedPower.
     """
 
     return powerFit(par, x) - y
@@ -107,10 +104,17 @@ def genRefCurve(speedRaw, powerRaw, binSpeed = 0.5):
     >>> plt.show()
     """
 
-    tckRef = interpolate.splrep(speedRaw, powerRaw, s=0)
-    speedRef = np.arange(speedRaw.min(), speedRaw.max(), binSpeed)
-    powerRef = interpolate.splev(speedRef, tckRef, der=0)
-    return speedRef, powerRef
+    return ew.RefCurve(speedRaw, powerRaw).grid(binSpeed)
+
+
+def refCurveFromFile(fileName=r'refdata.csv', delimiter=';', binSpeed = 0.5):
+    """ Reads and interpolates the reference curve of a CSV file (cached until the file changes).
+    >>> speedRef, powerRef = refCurveFromFile(fileName='refdata.csv', binSpeed = 0.5)
+    >>> refCurve = ew.getRefCurve('refdata.csv')
+    >>> powerRefAtSpeed = refCurve(speed)
+    """
+
+    return ew.getRefCurve(fileName, delimiter=delimiter).grid(binSpeed)
 
 
 def energyLost(refData, expData, binSpeed = 0.5):
@@ -9,22 +9,24 @@ Distributed under the MIT License.
 import Plugins as ep
 
 import numpy as np
-import scipy.optimize as optimize
-from scipy import interpolate
 from scipy import integrate
-import datetime as dt
 import matplotlib.pyplot as plt
 from Tkinter import *
 import tkFileDialog
 import ctypes
 from ctypes.wintypes import MAX_PATH
-import csv
 import string
 
 from mpl_toolkits.mplot3d import axes3d, Axes3D
 from matplotlib.collections import PolyCollection
 from matplotlib.colors import colorConverter
 
+# Modulos compartilhados (Common)
+import epmOutliers as eo
+import epmWind as ew
+import epmProfiles as epf
+import epmPlot as epl
+
 dll = ctypes.windll.shell32
 myDocsDir = ctypes.create_unicode_buffer(MAX_PATH + 1)
 dll.SHGetSpecialFolderPathW(None, myDocsDir, 0x0005, False)
@@ -33,6 +35,8 @@ dll.SHGetSpecialFolderPathW(None, myDocsDir, 0x0005, False)
 nominalPower = 3000.0 # Potencia nominal [KW]
 minSpeed = 4.0 # velocidade minima para operar aerogerador [m/s]
 supplierCurveFile = myDocsDir.value + '\\Refdata3000.csv'
+fittedParams = {} # ultimos parametros ajustados para cada par de penas (warm start)
+cleaner = ew.SpeedPowerCleaner(minSpeed, nominalPower) # regras de limpeza dos dados (ver cleaner.report)
 
 # Grafico velocidade do vento vs potencia
 @ep.DatasetFunctionPlugin('Wind Speed X Power Chart', 2)
@@ -51,9 +55,8 @@ def windSpeedPowerChart():
     rawSpeed, rawPower = getSpeedPowerValues(ep.EpmDatasetPens.SelectedPens[0], ep.EpmDatasetPens.SelectedPens[1])
     speed, power = cleanSpeedPowerData(rawSpeed, rawPower, minSpeed, nominalPower )
     xm, ym = windPowerAverage(speed, power)
-    par0 = [1.0, 1.0, 1500.0, 1.0]
+    parest = fitSpeedPower(ep.EpmDatasetPens.SelectedPens, xm, ym)
     binSpeed = 0.5
-    parest,cov,infodict,mesg,ier = optimize.leastsq(residualsSPPn4, par0, args=(xm, ym), full_output=True)
     xEst = np.arange(xm.min(), xm.max(), binSpeed)
     yEst = powerFitPn4(parest, xEst)
     posAbove = np.argwhere(yEst > nominalPower)
@@ -87,18 +90,13 @@ def suplierSpeedPowerChart():
     rawSpeed, rawPower = getSpeedPowerValues(ep.EpmDatasetPens.SelectedPens[0], ep.EpmDatasetPens.SelectedPens[1])
     speed, power = cleanSpeedPowerData(rawSpeed, rawPower, minSpeed, nominalPower )
     xm, ym = windPowerAverage(speed, power)
-    par0 = [1.0, 1.0, 1500.0, 1.0]
+    parest = fitSpeedPower(ep.EpmDatasetPens.SelectedPens, xm, ym)
     binSpeed = 0.5
-    parest,cov,infodict,mesg,ier = optimize.leastsq(residualsSPPn4, par0, args=(xm, ym), full_output=True)
     xEst = np.arange(xm.min(), xm.max(), binSpeed)
     yEst = powerFitPn4(parest, xEst)
     posAbove = np.argwhere(yEst > nominalPower)
     yEst[posAbove] = nominalPower
-    speedRef, powerRef = readFromCsv(fileName=supplierCurveFile, delimiter=';')
-    tckRef = interpolate.splrep(speedRef, powerRef, s=0)
-    binSpeed = 0.5
-    xRef = np.arange(speedRef.min(), speedRef.max(), binSpeed)
-    yRef = interpolate.splev(xRef, tckRef, der=0)
+    xRef, yRef = ew.getRefCurve(supplierCurveFile, delimiter=';').grid(binSpeed)
     energyLost = integrate.simps(yRef, dx=binSpeed) - integrate.simps(yEst, dx=binSpeed)
     fig1 = plt.figure()
     ax1 = fig1.add_subplot(1, 1, 1)
@@ -180,12 +178,12 @@ def PolarBarWind():
     speed, direction, power = getSpeedPowerDirectionValues(ep.EpmDatasetPens.SelectedPens[0], ep.EpmDatasetPens.SelectedPens[1],
                                                            ep.EpmDatasetPens.SelectedPens[2])
     spd4, dir4, pow4 = groupByDirection(speed, direction, power)
-    width = pow4/1000.
+    width = (np.pi/2) * pow4/np.nanmax(pow4) # largura proporcional a potencia media (max. = setor de 90 graus)
     ax1 = plt.subplot(111, polar=True)
     ax1.set_theta_zero_location('N')
     ax1.set_theta_direction(-1)
     ax1.xaxis.set_ticklabels(['N',r"$45^{o}$",'E',r"$135^{o}$",'S',r"$225^{o}$",'W', r"$315^{o}$"])
-    bars = ax1.bar(dir4, spd4, width=width, bottom=0.0)
+    bars = ax1.bar(np.radians(dir4), spd4, width=width, bottom=0.0)
     for r, bar in zip(spd4, bars):
         bar.set_facecolor(plt.cm.jet(r / 10.))
         bar.set_alpha(0.5)
@@ -240,139 +238,65 @@ def getSpeedPowerDirectionValues(pen1, pen2, pen3):
 
 # Funcao que remove os dados que nao fazem sentido e/ou expurios
 def cleanSpeedPowerData(speedData, powerData, minSpeed, nominalPower):
-    pPos = np.argwhere(powerData < 0.)
-    speed = np.delete(speedData, pPos)
-    power = np.delete(powerData, pPos)
-    pPos = np.argwhere(powerData > nominalPower)
-    speed = np.delete(speed, pPos)
-    power = np.delete(power, pPos)
-    pPos = np.argwhere(speed < minSpeed)
-    speed = np.delete(speed, pPos)
-    power = np.delete(power, pPos)
-    return speed, power
+    cleaner.minSpeed = minSpeed
+    cleaner.nominalPower = nominalPower
+    return cleaner.apply(speedData, powerData)
 
-# Determinacao dos valores medios de potencia para cada valor de velocidade
-def windPowerAverage(speed, power):
-    pos = np.argsort(speed)
-    x = speed[pos].copy()
-    y = power[pos].copy()
-    xm = []
-    ym = []
-    i = 0
-    while i < (len(x)):
-        p = np.where(x == x[i])
-        xm.append(x[p].mean())
-        ym.append(y[p].mean())
-        i = p[0][-1] + 1
-    return np.array(xm), np.array(ym)
+# Determinacao dos valores medios de potencia para cada valor de velocidade (ou faixa de velocidade - binSpeed)
+def windPowerAverage(speed, power, binSpeed=None):
+    return ew.windPowerAverage(speed, power, binSpeed)
 
 # Curva de potencia com o vento - estimando a P nominal
 def powerFitPn4(par, x):
-    return par[2] / (par[3] + np.exp(-(par[0] * x + par[1])))
+    return ew.powerFitPn4(par, x)
 
-# Residuos para estimar parametros da curva de Pot com o Vento estimando tbm Pnominal
-def residualsSPPn4(par, x, y):
-    return powerFitPn4(par, x) - y
+# Ajusta a curva de potencia (jacobiano analitico) partindo dos ultimos parametros ajustados para as mesmas penas
+def fitSpeedPower(pens, xm, ym):
+    global fittedParams
+    penKey = tuple(pen.Name for pen in pens)
+    parest = ew.fitPowerCurve(xm, ym, par0=fittedParams.get(penKey))
+    if not np.isnan(parest).any():
+        fittedParams[penKey] = parest
+    return parest
 
 # Importar de um arquivo CSV (duas colunas de dados) \TODO: generalizar para N colunas
 def readFromCsv( fileName, delimiter=';' ):
-    f = csv.reader(open(fileName), delimiter=delimiter)
-    cd1,cd2 = [], []
-    for (c1, c2) in f:
-        c1 = c1.replace(',', '.')
-        c2 = c2.replace(',', '.')
-        cd1.append(float(c1))
-        cd2.append(float(c2))
-    return np.array(cd1), np.array(cd2)
+    return ew.readCurveCsv(fileName, delimiter)
 
 # Retorna o percentual de tempo que a variavel ficou em cada periodo
-def percentTimeIn(epmData):
+def percentTimeIn(epmData, nSectors = 8):
     t,y = rmNanAndOutliers2(epmData)
-    minVal = 0
-    maxVal = 360
-    step = int((maxVal-minVal)/8)
-    nodes = range(minVal,maxVal,step)
-    intervNum = np.size(nodes)+1
-    totTime = np.empty(intervNum, dtype=object)
-    totTime.fill(dt.timedelta(0,0))
-    for i in range(1,np.size(y)):
-        deltaT = t[i] - t[i-1]
-        ix = np.digitize([y[i]], nodes)
-        totTime[ix] += deltaT
-    nodesPercents = np.zeros([np.size(totTime),2])
-    totalPeriod = totTime.sum().total_seconds()
-    for i in range(np.size(totTime)):
-        if i:
-           nodesPercents[i,0] = nodes[i-1]
-        else:
-           nodesPercents[i,0] = -np.inf
-        nodesPercents[i,1] = totTime[i].total_seconds()/totalPeriod
-    nodesLabels = []
-    for item in nodesPercents[:,0]:
-        nodesLabels.append(angle2cardinal(item))
-    return nodesPercents, nodesLabels
+    rose = ew.WindRose(nSectors).update(y, t=t)
+    nodesPercents = np.column_stack((ew.sectorCenters(nSectors), rose.timeFractions().sum(axis=1)))
+    return nodesPercents, list(ew.sectorLabels(nSectors)[:nSectors])
 
 def angle2cardinal(degAngle):
-    cardList = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
-    degBaseList = range(0, 360, 360/8)
-    degBand = 360/16.
-    dir = 0
-    if degAngle> degBaseList[1]-degBand and degAngle<= degBaseList[2]-degBand:
-        dir = 1
-    elif degAngle> degBaseList[2]-degBand and degAngle<= degBaseList[3]-degBand:
-        dir = 2
-    elif degAngle> degBaseList[3]-degBand and degAngle<= degBaseList[4]-degBand:
-        dir = 3
-    elif degAngle> degBaseList[4]-degBand and degAngle<= degBaseList[5]-degBand:
-        dir = 4
-    elif degAngle> degBaseList[5]-degBand and degAngle<= degBaseList[6]-degBand:
-        dir = 5
-    elif degAngle> degBaseList[6]-degBand and degAngle<= degBaseList[7]-degBand:
-        dir = 6
-    elif degAngle> degBaseList[7]-degBand and degAngle<= 360-degBand:
-        dir = 7
-    return cardList[dir]
+    sector, labels = ew.compassSectors(degAngle, 8)
+    return labels[sector]
 
 # Converte todos os valores de graus nas 4 direcoes principais (em graus)
+# Norte: 315 <= DEG < 45, Leste: 45 <= DEG < 135, Sul: 135 <= DEG < 225, Oeste: 225 <= DEG < 315
 def allDeg24Directions(degVector):
-    fourDirVector = degVector.copy()
-    # Norte:  315 <= DEG < 45
-    pos = np.argwhere(degVector >= 315)
-    fourDirVector[pos] = 0.0 # Norte
-    pos = np.argwhere(degVector<45)
-    fourDirVector[pos] = 0.0 # Norte
-    # Leste:  45 <= DEG < 135
-    pos = np.argwhere(np.logical_and(degVector>=45, degVector<135))
-    fourDirVector[pos] = 90.0 # Leste
-    # Sul:  135 <= DEG < 225
-    pos = np.argwhere(np.logical_and(degVector>=135, degVector<225))
-    fourDirVector[pos] = 180.0 # Sul
-    # Oeste:  225 <= DEG < 315
-    pos = np.argwhere(np.logical_and(degVector>=225, degVector<315))
-    fourDirVector[pos] = 270.0 # Oeste
-    return fourDirVector
-
-# Plota o perfil diario da direcao do vento (4 direcoes principais) - dados devem estar interpolados a cada 10 minutos e fechando dias completos de 24h
+    sector, labels = ew.compassSectors(degVector, 4)
+    return np.append(ew.sectorCenters(4), np.nan)[sector]
+
+# Acima deste numero de dias o perfil diario e apresentado como mapa de calor
+HEATMAP_DAYS = 31
+
+# Plota o perfil diario da direcao do vento (4 direcoes principais) - intervalo de amostragem inferido dos Timestamps
 def plot4MainDir(degVector):
     fourDirVector = allDeg24Directions(degVector['Value'])
-    pHours = 24 # periodo considerado
-    sampling = 60 # 10min de amostragem
-    base = pHours*60/sampling
-    totDays = len(fourDirVector)/base  # Dias multiplo de 5, para graficos poly 3d
-    days  = np.arange(totDays)+1
-    hours = np.arange(0,pHours*60,sampling)
+    days, hours, meshProfile = epf.dailyProfile(degVector['Timestamp'], fourDirVector)
+    if len(days) > HEATMAP_DAYS:
+        # periodos longos: mapa de calor (dia x hora do dia) em vez de superficie e poligonos
+        fig = plt.figure()
+        epl.calendarHeatmap(fig.gca(), days, hours, meshProfile, label='Dir')
+        plt.show()
+        return
+    hours = hours * 60. # minutos
+    totDays = len(days)
+    days = np.arange(totDays) + 1
     meshTime, indices = np.meshgrid(hours, days)
-    meshProfile = np.zeros(meshTime.shape)
-    profileList = []
-    ii = 1
-    for i in range(totDays):
-        dataPeriod = fourDirVector[i*base:ii*base]
-        profileList.append( dataPeriod )
-        ii +=1
-    profileMatrix = np.array(profileList)
-    for i in range( indices.shape[0] ):
-        for j in range( indices.shape[1] ):
-            meshProfile[(i,j)] = profileMatrix[(i,j)]
 
     fig = plt.figure()
     ax = fig.gca(projection='3d')
@@ -389,11 +313,10 @@ def plot4MainDir(degVector):
     ax2 = fig2.gca(projection='3d')
     cc = lambda arg: colorConverter.to_rgba(arg, alpha=0.6)
     verts = []
-    cs = [cc('r'), cc('g'), cc('b'), cc('y'), cc('c')]*(totDays/5)
-    k = 0
-    for d in days:
-        verts.append(list(zip(hours, meshProfile[k])))
-        k += 1
+    cs = [cc('r'), cc('g'), cc('b'), cc('y'), cc('c')]
+    cs = [cs[k % 5] for k in range(totDays)]
+    for k in range(totDays):
+        verts.append(list(zip(hours, np.nan_to_num(meshProfile[k]))))
     poly = PolyCollection(verts, facecolors = cs)
     poly.set_alpha(0.7)
     ax2.add_collection3d(poly, zs=days, zdir='y')
@@ -415,47 +338,15 @@ def plot4MainDir(degVector):
     plt.show()
 
 
-def groupByDirection(speed, power, direction):
-    posN =[]
-    posE =[]
-    posS =[]
-    posW =[]
-    bins  = np.array([0, 45, 135, 225, 315, 360])
-    pos = np.digitize(direction, bins)
-    for n in range(direction.size):
-        if pos[n] == 1:
-            posN.append(n)
-        elif pos[n] == 2:
-            posE.append(n)
-        elif pos[n] == 3:
-            posS.append(n)
-        elif pos[n] == 4:
-            posW.append(n)
-        else:
-            posN.append(n)
-    speed4dir = np.array([speed[posN].mean(), speed[posE].mean(), speed[posS].mean(), speed[posW].mean()])
-    power4dir = np.array([power[posN].mean(), power[posE].mean(), power[posS].mean(), power[posW].mean()])
-    dir = np.array([0, 90, 180, 270])
-    return speed4dir, dir, power4dir
+# Velocidade e potencia medias em cada direcao (4 direcoes principais, em graus)
+def groupByDirection(speed, direction, power, nSectors=4):
+    rose = ew.WindRose(nSectors).update(direction, speed, power)
+    return rose.meanSpeed(axis=1), ew.sectorCenters(nSectors), rose.meanPower(axis=1)
 
 
 # Remove dados Nan e Outliers baseado no desvio padrao e retorna vetores t e y
 def rmNanAndOutliers2(epmData, sd = 6):
-    y = epmData['Value']
-    t = epmData['Timestamp']
-    nanPos = np.argwhere(np.isnan(y))
-    y = np.delete(y,nanPos)
-    t = np.delete(t,nanPos)
-    s3 = np.floor(sd * np.sqrt(y.std()))
-    smin = y.mean() - s3
-    smax = y.mean() + s3
-    outPos = np.argwhere(y<smin)
-    y = np.delete(y,outPos)
-    t = np.delete(t,outPos)
-    outPos = np.argwhere(y>smax)
-    y = np.delete(y,outPos)
-    t = np.delete(t,outPos)
-    return t,y
+    return eo.rmNanAndOutliers(epmData, sd)
 
 
 
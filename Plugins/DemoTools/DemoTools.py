@@ -12,7 +12,6 @@ import ScriptRunner as sr
 
 # Numpy, Scipy and Matplotlib modules
 import numpy as np
-from scipy import integrate
 import matplotlib.pylab as pl
 import matplotlib as mpl
 from matplotlib.widgets import Cursor
@@ -20,6 +19,14 @@ from matplotlib.widgets import SpanSelector
 from matplotlib.widgets import RectangleSelector
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
+# Modulos compartilhados (Common)
+import epmArray as ea
+import epmOutliers as eo
+import epmLazy as el
+import epmPlot as epl
+import epmStats as es
+import epmTimeStats as ets
+
 
 @ds.epm_dataset_method_plugin('Remove NAN and Outliers', 1, 'res')
 def rmNanAndOutliers():
@@ -29,22 +36,9 @@ def rmNanAndOutliers():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     sd = 6
-    epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    y = epmData['Value']
-    t = epmData['Timestamp']
-    nanPos = np.argwhere(np.isnan(y))
-    y = np.delete(y,nanPos)
-    t = np.delete(t,nanPos)
-    s3 = np.floor(sd * np.sqrt(y.std()))
-    smin = y.mean() - s3
-    smax = y.mean() + s3
-    outPos = np.argwhere(y<smin)
-    y = np.delete(y,outPos)
-    t = np.delete(t,outPos)
-    outPos = np.argwhere(y>smax)
-    y = np.delete(y,outPos)
-    t = np.delete(t,outPos)
-    res = vec2epm(t,y)
+    epmData = ea.EpmArray.fromEpm(ds.EpmDatasetAnalysisPens.SelectedPens[0].values)
+    keep = eo.nanOutliersMask(epmData['Value'], sd)
+    res = epmData[keep].toEpm()
     penName = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_NoOutliers'
     sr.plot(penName, res)
     return res
@@ -57,10 +51,9 @@ def deltaVector():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    delta = epmData['Value'][1:] - epmData['Value'][:-1]
-    deltaCurves = epmData.copy();
+    deltaCurves = ea.derivedPen(epmData)
     deltaCurves['Value'][0] = 0
-    deltaCurves['Value'][1:] = delta
+    np.subtract(epmData['Value'][1:], epmData['Value'][:-1], out=deltaCurves['Value'][1:])
     penName = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_Delta'
     sr.plot(penName, deltaCurves)
     return deltaCurves
@@ -73,8 +66,9 @@ def removeMean():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    rmMean = epmData.copy();
-    rmMean['Value'] = epmData['Value'] - epmData['Value'].mean()
+    st = penStats(ds.EpmDatasetAnalysisPens.SelectedPens[0])
+    rmMean = ea.derivedPen(epmData)
+    np.subtract(epmData['Value'], st['mean'], out=rmMean['Value'])
     penName = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_ZeroMean'
     sr.plot(penName, rmMean)
     return rmMean
@@ -87,8 +81,10 @@ def normalizeData():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    nc = epmData.copy();
-    nc['Value'] = (epmData['Value'] - epmData['Value'].mean())/epmData['Value'].std()
+    st = penStats(ds.EpmDatasetAnalysisPens.SelectedPens[0])
+    nc = ea.derivedPen(epmData)
+    np.subtract(epmData['Value'], st['mean'], out=nc['Value'])
+    nc['Value'] /= st['std']
     penName = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_Normalized'
     sr.plot(penName, nc)
     return nc
@@ -100,11 +96,13 @@ def statsInfos():
     if len(ds.EpmDatasetAnalysisPens.SelectedPens) != 1:
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
-    epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    v = epmData['Value']
-    vmean = v.mean()
-    vstd = v.std()
+    st = penStats(ds.EpmDatasetAnalysisPens.SelectedPens[0], quantiles=(50,))
+    vmean = st['mean']
+    vstd = st['std']
     statMsg = 'Mean: ' + '%.2f' % (vmean) + '\nStdDev: ' + '%.2f' % (vstd)
+    statMsg += '\nMin: ' + '%.2f' % (st['min']) + '\nMax: ' + '%.2f' % (st['max'])
+    statMsg += '\nMedian: ' + '%.2f' % (st['quantiles'][50])
+    statMsg += '\nSamples: ' + '%d' % (st['count']) + '\nNaN: ' + '%d' % (st['nanCount'])
     sr.msgBox('EPM PyPlugin!', statMsg, 'Information')
     return (vmean, vstd)
 
@@ -130,12 +128,38 @@ def integralData():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    v = epmData['Value']
-    curveArea = integrate.simps(v)
-    statMsg = 'Integral: ' + '%.2f' % (curveArea)
+    curveArea = ets.integrate(epmData['Timestamp'], epmData['Value'], 'simpson', unit='s')
+    statMsg = 'Integral: ' + '%.2f' % (curveArea) + ' (value x s)\n' + '%.2f' % (curveArea / 3600.) + ' (value x h)'
     sr.msgBox('EPM PyPlugin!', statMsg, 'Information')
     return curveArea
 
+@ds.epm_dataset_method_plugin('Cumulative Integral', 13, 'cumIntegral')
+def cumulativeIntegralData():
+    """ Plot the running integral (value x h, e.g. kWh from kW) from selected pen.
+    """
+    if len(ds.EpmDatasetAnalysisPens.SelectedPens) != 1:
+        sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
+        return 0
+    epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
+    cumIntegral = ea.derivedPen(epmData, ets.cumulativeIntegral(epmData['Timestamp'], epmData['Value'], unit='h'))
+    penName = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_Integral'
+    sr.plot(penName, cumIntegral)
+    return cumIntegral
+
+@ds.epm_dataset_method_plugin('Clean, Normalize and Delta', 14, 'res')
+def cleanNormalizeDelta():
+    """ Plot the deltas of the normalized data without NAN and outliers from selected pen,
+    in a single fused pass (same as Remove NAN and Outliers -> Remove Mean -> Normalize Curve -> Delta).
+    """
+    if len(ds.EpmDatasetAnalysisPens.SelectedPens) != 1:
+        sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
+        return 0
+    epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
+    res = el.LazyPen(epmData).rmNanAndOutliers(6).removeMean().normalize().delta().toEpm()
+    penName = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_CleanNormDelta'
+    sr.plot(penName, res)
+    return res
+
 @ds.epm_dataset_method_plugin('Plot XY', 8)
 def plotXY():
     """ Plot XY from selected pens.
@@ -146,8 +170,8 @@ def plotXY():
         return 0
     epmData1 = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
     epmData2 = ds.EpmDatasetAnalysisPens.SelectedPens[1].values
-    pl.figure
-    pl.plot(epmData1['Value'], epmData2['Value'])
+    pl.figure()
+    epl.LodLine(pl.gca(), epmData1['Value'], epmData2['Value'], xy=True)
     pl.show()
 
 @ds.epm_dataset_method_plugin('Plot Min-Max', 9, 'minmax')
@@ -158,12 +182,11 @@ def plotMinMax():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    minValue = epmData['Value'].min();
-    maxValue = epmData['Value'].max();
-    vmin = epmData.copy()
-    vmax = epmData.copy()
-    vmin['Value'][:] = minValue
-    vmax['Value'][:] = maxValue
+    st = penStats(ds.EpmDatasetAnalysisPens.SelectedPens[0])
+    minValue = st['min'];
+    maxValue = st['max'];
+    vmin = ea.constantPen(epmData, minValue)
+    vmax = ea.constantPen(epmData, maxValue)
     penMin = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_Min'
     penMax = ds.EpmDatasetAnalysisPens.SelectedPens[0].name + '_Max'
     sr.plot(penMin, vmin)
@@ -179,13 +202,16 @@ def plotGetPoints():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    y = epmData['Value'].copy()
+    y = epmData['Value']
     x = np.arange(len(y))
     fig = pl.figure(figsize=(8, 6))
     ax = fig.add_subplot(111, axisbg='#FFFFFF')
-    ax.plot(x, y, '-o')
+    epl.LodLine(ax, x, y, linestyle='-', marker='o')
     def onclick(event):
-        selPoints.append((event.xdata, event.ydata))
+        # amostra original mais proxima: (indice, Timestamp, valor)
+        if event.inaxes is ax and event.xdata is not None:
+            i = epl.nearestIndex(x, event.xdata)
+            selPoints.append((i, epmData['Timestamp'][i], y[i]))
     cursor = Cursor(ax, useblit=True, color='red', linewidth=1 )
     cid = fig.canvas.mpl_connect('button_press_event', onclick)
     pl.show()
@@ -200,24 +226,24 @@ def plotGetSelection():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    y = epmData['Value'].copy()
+    y = epmData['Value']
     x = np.arange(len(y))
     fig = pl.figure(figsize=(8,6))
     ax = fig.add_subplot(211, axisbg='#FFFFCC')
-    ax.plot(x, y, '-')
+    epl.LodLine(ax, x, y, linestyle='-')
     ax.set_title('Press left mouse button and drag to test')
     ax2 = fig.add_subplot(212, axisbg='#FFFFCC')
-    line2, = ax2.plot(x, y, '-')
+    epl.LodLine(ax2, x, y, linestyle='-')
 
     def onselect(xmin, xmax):
-        selData.append([xmin, xmax])
-        indmin, indmax = np.searchsorted(x, (xmin, xmax))
-        indmax = min(len(x)-1, indmax)
-        thisx = x[indmin:indmax]
+        # intervalo [indmin, indmax[ das amostras originais selecionadas
+        indmin, indmax = epl.indexRange(x, xmin, xmax)
+        if indmax - indmin < 2:
+            return
+        selData.append([indmin, indmax, epmData['Timestamp'][indmin], epmData['Timestamp'][indmax-1]])
         thisy = y[indmin:indmax]
-        line2.set_data(thisx, thisy)
-        ax2.set_xlim(thisx[0], thisx[-1])
-        ax2.set_ylim(thisy.min(), thisy.max())
+        ax2.set_ylim(np.nanmin(thisy), np.nanmax(thisy))
+        ax2.set_xlim(x[indmin], x[indmax-1])
         fig.canvas.draw()
 
     span = SpanSelector(ax, onselect, 'horizontal', useblit=True, rectprops=dict(alpha=0.5, facecolor='red') )
@@ -233,17 +259,17 @@ def plotGetRetangle():
         sr.msgBox('EPM Python Plugin - Demo Tools', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ds.EpmDatasetAnalysisPens.SelectedPens[0].values
-    y = epmData['Value'].copy()
+    y = epmData['Value']
     x = np.arange(len(y))
     fig, current_ax = pl.subplots()
-    pl.plot(x, y, lw=2, c='g', alpha=.3)
+    epl.LodLine(current_ax, x, y, lw=2, c='g', alpha=.3)
 
     def line_select_callback(eclick, erelease):
         'eclick and erelease are the press and release events'
         x1, y1 = eclick.xdata, eclick.ydata
         x2, y2 = erelease.xdata, erelease.ydata
         print ("\n(%3.2f, %3.2f) --> (%3.2f, %3.2f)" % (x1, y1, x2, y2))
-        selRect.append((int(x1), y1, int(x2), y2))
+        selRect.append((epl.nearestIndex(x, x1), y1, epl.nearestIndex(x, x2), y2))
 
     def toggle_selector(event):
         if event.key in ['Q', 'q'] and toggle_selector.RS.active:
@@ -259,23 +285,22 @@ def plotGetRetangle():
 # *** Extra functions ***
 def vec2epm(t, y):
     """ Convert datetime vector and data vector into EPM array (numpy array)
-    t: datetime vector
+    t: datetime vector (datetime or datetime64)
     y: double data vector
     """
-    desc = np.dtype([('Value', '>f8'), ('Timestamp', 'object'), ('Quality', 'object')])
-    epmY = np.empty([np.size(y)], dtype = desc)
-    epmY['Value'] = y
-    epmY['Timestamp'] = t
-    epmY['Quality'] = 0
-    return epmY
+    return ea.vec2epm(t, y)
+
+def penStats( pen, quantiles = () ):
+    """ Descriptive statistics (NaN aware) of a pen, cached by pen name and query range
+    pen: dataset pen (name and values)
+    quantiles: percentiles (0-100) to compute
+    """
+    epmData = pen.values
+    return es.statsCache.get(es.rangeKey(pen.name, epmData), epmData['Value'], quantiles)
 
-def invCount( y ):
-    """ Count direction changes
+def invCount( y, deadband = 0.0 ):
+    """ Count direction changes (plateaus keep the last direction, NaN are skipped)
     y: double data vector
+    deadband: changes smaller than deadband are ignored (hysteresis)
     """
-    d = y[1:] - y[:-1]
-    n = 0
-    for i in range(len(d)-1):
-        if np.sign(d[i]) != np.sign(d[i+1]):
-           n += 1
-    return n
+    return es.countReversals(y, deadband)
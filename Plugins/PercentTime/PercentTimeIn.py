@@ -22,7 +22,10 @@ from matplotlib.widgets import Cursor
 from matplotlib.widgets import SpanSelector
 from matplotlib.widgets import RectangleSelector
 from mpl_toolkits.axes_grid1 import make_axes_locatable
-import datetime as dtt
+
+# Modulos compartilhados (Common)
+import epmTimeStats as ets
+import epmOutliers as eo
 
 # Dialog Tkinter
 from Tkinter import *
@@ -42,26 +45,12 @@ def percentTimeIn():
     runDialogInterval()
     global nodes
     t,y = rmNanAndOutliers2(epmData)
-    if len(nodes) < 2:
+    if np.size(nodes) < 2:
        minVal = int(np.floor(np.nanmin(y)))
        maxVal = int(np.ceil(np.nanmax(y)))
-       step = int((maxVal-minVal)/3)
+       step = max(int((maxVal-minVal)/3), 1)
        nodes = range(minVal,maxVal,step)
-    intervNum = np.size(nodes)+1
-    totTime = np.empty(intervNum, dtype=object)
-    totTime.fill(dtt.timedelta(0,0))
-    for i in range(1,np.size(y)):
-        dt = t[i] - t[i-1]
-        ix = np.digitize([y[i]], nodes)
-        totTime[ix] += dt
-    nodesPercents = np.zeros([np.size(totTime),2])
-    totalPeriod = totTime.sum().total_seconds()
-    for i in range(np.size(totTime)):
-        if i:
-           nodesPercents[i,0] = nodes[i-1]
-        else:
-           nodesPercents[i,0] = -np.inf
-        nodesPercents[i,1] = totTime[i].total_seconds()/totalPeriod
+    nodesPercents = ets.percentTimeIn(t, y, nodes)
     labels = []
     for item in nodesPercents[:,0]:
         labels.append(str(item))
@@ -112,18 +101,4 @@ class DialogGetInterval():
         self.raiz.destroy()
 
 def rmNanAndOutliers2(epmData, sd = 6):
-    y = epmData['Value']
-    t = epmData['Timestamp']
-    nanPos = np.argwhere(np.isnan(y))
-    y = np.delete(y,nanPos)
-    t = np.delete(t,nanPos)
-    s3 = np.floor(sd * np.sqrt(y.std()))
-    smin = y.mean() - s3
-    smax = y.mean() + s3
-    outPos = np.argwhere(y<smin)
-    y = np.delete(y,outPos)
-    t = np.delete(t,outPos)
-    outPos = np.argwhere(y>smax)
-    y = np.delete(y,outPos)
-    t = np.delete(t,outPos)
-    return t,y
\ No newline at end of file
+    return eo.rmNanAndOutliers(epmData, sd)
\ No newline at end of file
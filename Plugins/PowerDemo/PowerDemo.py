@@ -11,11 +11,16 @@ import Plugins as ep
 # Numpy, Matplotlib, etc. modules
 import numpy as np
 from mpl_toolkits.mplot3d import Axes3D
-from matplotlib.collections import PolyCollection
-from matplotlib.colors import colorConverter
 import matplotlib.pyplot as plt
 plt.style.use('ggplot')
-import datetime as dt
+
+# Modulos compartilhados (Common)
+import epmProfiles as epf
+import epmStats as es
+import epmPlot as epl
+
+# Acima deste numero de dias os perfis diarios sao apresentados como mapa de calor
+HEATMAP_DAYS = 31
 
 
 @ep.DatasetFunctionPlugin('Power Surface', 2)
@@ -23,42 +28,26 @@ def thirtyDaysProfilePlugin():
     """
     Gera uma superfície para avaliar a variação diária e ao longo do mês (30 dias).
     Dados devem corresponder a uma consulta com 30 dias e serem interpolados (ProcessingInterval < 1h).
+    O intervalo de amostragem e inferido dos Timestamps; falhas e dias de horario de verao ficam com NaN.
+    Com mais de HEATMAP_DAYS dias é apresentado um mapa de calor (dia x hora do dia).
     """
     if len(ep.EpmDatasetPens.SelectedPens) != 1:
         ep.showMsgBox('EPM Python Plugin - Demo Power', 'Please select a single pen before applying this function!', 'Warning')
         return 0
     epmData = ep.EpmDatasetPens.SelectedPens[0].Values
-    sampling = 30
-    pHours = 24
-    iniPeriod = epmData['Timestamp'][0]
-    endPeriod = epmData['Timestamp'][-1]
-    dTotal = endPeriod - iniPeriod
-    totDays = dTotal.days
-    evalPeriod = dt.timedelta(hours = pHours)
-    nextPeriod = iniPeriod + evalPeriod
-    profileList = []
-    for i in range(totDays+1):
-        iniP = epmData['Timestamp'] >= iniPeriod
-        endP = epmData['Timestamp'] < nextPeriod
-        epmDataValue = epmData['Value']
-        dataPeriod = epmDataValue[iniP * endP]
-        profileList.append( dataPeriod )
-        iniPeriod = iniPeriod + dt.timedelta( 1 )
-        nextPeriod = iniPeriod + evalPeriod
-    profileMatrix = np.array(profileList)
-    days  = np.arange(totDays)+1
-    hours = np.arange(0,pHours*60,sampling)
-    meshTime, indices = np.meshgrid(hours, days)
-    meshProfile = np.zeros(meshTime.shape)
-    for i in range( indices.shape[0] ):
-        for j in range( indices.shape[1] ):
-            meshProfile[i,j] = profileMatrix[i,j]
+    days, hours, meshProfile = epf.dailyProfile(epmData['Timestamp'], epmData['Value'])
+    if len(days) > HEATMAP_DAYS:
+        fig = plt.figure(figsize=(15, 8))
+        epl.calendarHeatmap(fig.gca(), days, hours, meshProfile, label='Power')
+        plt.show()
+        return
+    meshTime, indices = np.meshgrid(hours, np.arange(len(days)) + 1)
     fig = plt.figure(figsize=(15, 8))
     ax = fig.gca(projection='3d')
     X = meshTime
     Y = indices
     Z = meshProfile
-    ax.plot_surface(X/60., Y, Z, rstride=1, cstride=1, cmap='coolwarm', alpha=0.8)
+    ax.plot_surface(X, Y, Z, rstride=1, cstride=1, cmap='coolwarm', alpha=0.8)
     ax.set_xlabel('hour')
     ax.set_ylabel('day')
     ax.set_zlabel('Power')
@@ -67,48 +56,39 @@ def thirtyDaysProfilePlugin():
 @ep.DatasetFunctionPlugin('Power Avg. Profile', 4)
 def fiveDaysProfilePlugin():
     """
-    Gráfico de área do perfil diário médio da variável a partir de dados de 5 dias.
-    Dados devem corresponder a uma consulta de 5 dias (úteis) com valores médios a cada hora.
+    Perfil diário típico da variável (média, mediana e faixa P10-P90 por hora do dia) a partir de N dias.
+    O intervalo de amostragem e inferido dos Timestamps e os dados da pena não são alterados.
     """
     if len(ep.EpmDatasetPens.SelectedPens) != 1:
         ep.showMsgBox('EPM Python Plugin - Demo Power', 'Please select a single pen before applying this function!', 'Warning')
         return 0
-    def cc(arg): return colorConverter.to_rgba(arg, alpha=0.6)
-    epmDataValue = ep.EpmDatasetPens.SelectedPens[0].Values['Value']
-    epmAvg = np.vstack((epmDataValue[0:24], epmDataValue[24:2*24], epmDataValue[2*24:3*24], epmDataValue[3*24:4*24], epmDataValue[4*24:5*24]))
-    epmAvg = epmAvg.mean(axis=0)
-    epmAvg[0], epmAvg[-1] = 0,0
-    ys = np.arange(1, 25)
-    zs = [0., 1., 2., 3., 4., 5.]
-    profileList = []
-    profileList.append( list(zip(ys, epmAvg)))
-    ini = 0
-    end = 24
-    for i in range(5):
-        dataPeriod = epmDataValue[ini:end]
-        dataPeriod[0], dataPeriod[-1] = 0,0
-        profileList.append( list(zip(ys, dataPeriod)))
-        ini += 24
-        end += 24
-    poly = PolyCollection(profileList, facecolors=[cc('k'), cc('r'), cc('g'), cc('b'), cc('y'), cc('c')])
+    epmData = ep.EpmDatasetPens.SelectedPens[0].Values
+    prof = epf.typicalProfile(epmData['Timestamp'], epmData['Value'], quantiles=(10, 90))
+    hours = prof['hours']
     fig = plt.figure(figsize=(15, 8))
-    ax = fig.gca(projection='3d')
-    poly.set_alpha(0.7)
-    ax.add_collection3d(poly, zs=zs, zdir='y')
+    ax = fig.gca()
+    ax.fill_between(hours, prof['quantiles'][10], prof['quantiles'][90], color='b', alpha=0.3, label='P10-P90')
+    ax.plot(hours, prof['mean'], 'r', label='mean')
+    ax.plot(hours, prof['median'], 'k--', label='median')
     ax.set_xlabel('hour')
-    ax.set_xlim3d(1, 24)
-    ax.set_ylabel('day')
-    ax.set_ylim3d(-1, 6)
-    ax.set_zlabel('power')
-    ax.set_zlim3d(epmDataValue.min(), epmDataValue.max())
+    ax.set_xlim(0, 24)
+    ax.set_ylabel('power')
+    ax.legend()
     plt.show()
 
 
+# Acima deste numero de amostras os graficos de dispersao mostram a densidade (bins)
+DENSITY_SAMPLES = 20000
+DENSITY_BINS = 100
+VOXEL_BINS = 20
+
+
 @ep.DatasetFunctionPlugin('Scatter 3 variables', 6)
 def xyzScatter3DPlugin():
     """
     Apresenta gráficos de dispersão comparando 3 variáves entre si duas a duas e as 3 simultaneamente.
     Os dados das 3 variáveis devem estar igualmente espaçados.
+    Com mais de DENSITY_SAMPLES amostras são apresentados histogramas 2D e a contagem por voxel em 3D.
     """
     if len(ep.EpmDatasetPens.SelectedPens) != 3:
         ep.showMsgBox('EPM Python Plugin - Demo Power', 'Please select 3 pens before applying this function!', 'Warning')
@@ -125,22 +105,71 @@ def xyzScatter3DPlugin():
     ax2 = plt.subplot2grid((3, 3), (0, 1))
     ax3 = plt.subplot2grid((3, 3), (0, 2))
     ax4 = plt.subplot2grid((3, 3), (1, 0), colspan=3, rowspan=3,  projection='3d')
-    x = (epmDataX-epmDataX.mean())/epmDataX.std()
-    y = (epmDataY-epmDataY.mean())/epmDataY.std()
-    z = (epmDataZ-epmDataZ.mean())/epmDataZ.std()
-    ax1.scatter(x, y)
+    x = normalized(epmDataX)
+    y = normalized(epmDataY)
+    z = normalized(epmDataZ)
+    if len(x) > DENSITY_SAMPLES:
+        for ax, a, b in ((ax1, x, y), (ax2, x, z), (ax3, y, z)):
+            counts, (ae, be) = es.densityGrid([a, b], DENSITY_BINS)
+            ax.pcolormesh(ae, be, np.ma.masked_equal(counts, 0).T, cmap='viridis')
+        counts, (xe, ye, ze) = es.densityGrid([x, y, z], VOXEL_BINS)
+        i, j, k = np.nonzero(counts)
+        c = counts[i, j, k]
+        center = lambda e, idx: (e[idx] + e[idx + 1]) / 2.
+        ax4.scatter(center(xe, i), center(ye, j), center(ze, k), c=np.log10(c), s=5 + 45 * c / float(c.max()),
+                    cmap='viridis', depthshade=False)
+    else:
+        ax1.scatter(x, y)
+        ax2.scatter(x, z)
+        ax3.scatter(y, z)
+        #ax4.scatter(x, y, z, cmap='hot')
+        ax4.scatter(x, y, z)
     ax1.set_xlabel(Xlabel, fontsize=10)
     ax1.set_ylabel(Ylabel, fontsize=10)
-    ax2.scatter(x, z)
     ax2.set_xlabel(Xlabel, fontsize=10)
     ax2.set_ylabel(Zlabel, fontsize=10)
-    ax3.scatter(y, z)
     ax3.set_xlabel(Ylabel, fontsize=10)
     ax3.set_ylabel(Zlabel, fontsize=10)
-    #ax4.scatter(x, y, z, cmap='hot')
-    ax4.scatter(x, y, z)
     ax4.set_xlabel(Xlabel, fontsize=10)
     ax4.set_ylabel(Ylabel, fontsize=10)
     ax4.set_zlabel(Zlabel, fontsize=10)
     plt.tight_layout(pad=0.5, w_pad=0.5, h_pad=1.0)
     plt.show()
+
+
+@ep.DatasetFunctionPlugin('Correlation Matrix', 7)
+def correlationMatrixPlugin():
+    """
+    Apresenta a matriz de correlação (Pearson) entre as N penas selecionadas.
+    Os dados das variáveis devem estar igualmente espaçados (mesmo número de amostras).
+    """
+    pens = ep.EpmDatasetPens.SelectedPens
+    if len(pens) < 2:
+        ep.showMsgBox('EPM Python Plugin - Demo Power', 'Please select at least 2 pens before applying this function!', 'Warning')
+        return 0
+    if len(set(len(pen.Values) for pen in pens)) != 1:
+        ep.showMsgBox('EPM Python Plugin - Demo Power', 'The selected pens must have the same number of samples!', 'Warning')
+        return 0
+    labels = [pen.Name for pen in pens]
+    r = es.corrMatrix([pen.Values['Value'] for pen in pens])
+    fig = plt.figure(figsize=(8, 7))
+    ax = fig.gca()
+    im = ax.imshow(r, vmin=-1, vmax=1, cmap='RdBu_r', interpolation='nearest')
+    for i in range(len(labels)):
+        for j in range(len(labels)):
+            ax.text(j, i, '%.2f' % r[i, j], ha='center', va='center', fontsize=9)
+    ax.set_xticks(np.arange(len(labels)))
+    ax.set_xticklabels(labels, rotation=45, ha='right')
+    ax.set_yticks(np.arange(len(labels)))
+    ax.set_yticklabels(labels)
+    ax.grid(False)
+    fig.colorbar(im)
+    plt.tight_layout()
+    plt.show()
+
+
+def normalized(values):
+    """ (values - mean) / std, ignoring NaN.
+    """
+    st = es.describe(values)
+    return (np.asarray(values, dtype=np.float64) - st['mean']) / st['std']